@@ -1,9 +1,42 @@
 # Importamos las librerías necesarias
 from shiny import App, ui, reactive, render
+from shiny.session import session_context
+from starlette.applications import Starlette
+from starlette.routing import Mount, Route
 from shinywidgets import output_widget, render_widget
 import plotly.express as px
-from data_prep import load_data, make_features, robust_thresholds
+import numpy as np
+import pandas as pd
+from figures import table_figure, grouped_figure, empty_figure
+from stats import cached_bootstrap
+from profiling import attach as attach_profiling, traced
+from neighbors import row_of_id, nearest
+from export import iter_export, EXPORT_FORMATS, HAS_PARQUET
+from datasets import get_dataset, dataset_from_query, DATASETS, DEFAULT_DATASET
+from datasets import PROGRESSIVE_ROWS, on_load
+from warmup import cached_aggregate, start as start_warmup
+from warmup import health as warmup_health
+from data_prep import (
+    filter_rows,
+    take_cols,
+    resp_labels,
+    rows_in_bins,
+    intersect_rows,
+    cohort_span,
+    cohort_rows,
+    cohort_summary,
+    fold_top_k,
+    group_means,
+    acceptance_patterns,
+    sample_rows,
+    rows_digest,
+    RESP_LABELS,
+    SPEND_COLS,
+    PURCHASE_COLS,
+)
+from functools import partial
 from pathlib import Path
+import asyncio
 import sys
 
 
@@ -22,72 +55,867 @@ PAL = {
     "pink2":     "#e92189",
 }
 
-# Cargamos el dataset una única vez y generamos las variables derivadas
-df = make_features(load_data())
 
-# Calculamos los umbrales robustos (p99.5) para acotar los ejes y mejorar la
-# legibilidad sin depender de los máximos extremos
-thr = robust_thresholds(df)
+# Definimos los estilos comunes que se aplican una sola vez, al construir el
+# esqueleto de cada figura (ver figures.py)
+def style_no_legend(fig):
+    fig.update_layout(showlegend=False)
 
-# Construimos la barra lateral con filtros globales que afectan a todas las
-# pestañas
-sidebar = ui.sidebar(
-    ui.h4(
-        "Filtros globales",
-        style="margin-bottom:-10px;",
-    ),
-    ui.hr(
-        style="margin-top:0px; margin-bottom:0px;",
-    ),
-    ui.input_slider(
-        "recency",
-        "Días desde la última compra",
-        0,
-        int(df["Recency"].max()),
-        value=(0, 99),
-    ),
-    ui.input_slider(
-        "income",
-        "Rango de ingresos (Income)",
-        0,
-        int(thr["inc_p995"]),
-        value=(0, int(thr["inc_p995"])),
-    ),
-    ui.input_select(
-        "response",
-        "Respuesta a la última campaña (Response)",
-        choices=["Todas", "No aceptó (0)", "Aceptó (1)"],
-        selected="Todas",
-    ),
-    ui.input_action_button(
-        "reset",
-        "Restablecer filtros",
-        class_="btn-light",
-    ),
-    ui.hr(
-        style="margin-top:0px; margin-bottom:0px;",
-    ),
-    ui.h5("Resumen del filtro"),
-    ui.output_ui("kpi_text"),
-    ui.help_text(
-        ui.tags.span(
-            ui.tags.span("Response: "),
-            ui.tags.br(),
-            ui.tags.span("1 = aceptó la última campaña."),
-            ui.tags.br(),
-            ui.tags.span("0 = no aceptó."),
-            style="color:#ffffff;line-height:1.1;",
+
+def style_income(fig):
+    fig.update_traces(marker_line_color=PAL["edge"])
+    fig.update_layout(dragmode="select", clickmode="event+select")
+
+
+def style_recency_spend(fig):
+    fig.update_traces(marker_line_color=PAL["edge"])
+    fig.update_layout(dragmode="lasso")
+
+
+def style_rate(fig):
+    fig.update_yaxes(tickformat=".0%")
+
+
+def style_patterns(fig):
+    fig.update_traces(
+        marker_color=PAL["mag"],
+        marker_line_color=PAL["edge"],
+        texttemplate="n=%{text}",
+        textposition="outside",
+    )
+    fig.update_yaxes(tickformat=".0%")
+    fig.update_xaxes(tickangle=-45)
+
+
+# Establecemos los márgenes para mejorar la legibilidad de las vistas
+# normalizadas (cuotas) por Response y segmento
+def style_mix(fig):
+    fig.update_layout(
+        margin=dict(t=75, r=20, b=50, l=60),
+        title=dict(
+            y=0.98,
+            yanchor="top",
+            pad=dict(t=20, b=0),
+        ),
+    )
+    fig.update_traces(marker_line_color=PAL["edge"])
+    fig.update_yaxes(tickformat=".0%")
+
+
+def style_heat(fig):
+    fig.update_layout(
+        margin=dict(t=75, r=20, b=50, l=60),
+        title=dict(y=0.98, yanchor="top", pad=dict(t=20)),
+    )
+
+
+# Marcamos una figura de la vista preliminar (calculada sobre una muestra)
+def mark_preliminary(fig):
+    fig.add_annotation(
+        text="Preliminar (muestra)",
+        xref="paper",
+        yref="paper",
+        x=1.0,
+        y=1.0,
+        xanchor="right",
+        yanchor="bottom",
+        showarrow=False,
+        font=dict(color=PAL["pink"], size=11),
+    )
+    return fig
+
+
+# Definimos los códigos de filtrado de cada selección de Response (None si
+# es “Todas”)
+RESPONSE_CODES = {"Todas": None, "No aceptó (0)": 0, "Aceptó (1)": 1}
+
+
+# Definimos las vistas que admiten selección gráfica (brushing) y el número
+# de barras del histograma de Income
+BRUSH_SOURCES = ("fig_recency_spend", "fig_income")
+INCOME_BINS = 45
+
+# Calculamos la tabla agregada de una vista o la tomamos de la caché
+# compartida entre sesiones. Solo guardamos las vistas exactas (`key` =
+# huella de las filas filtradas): las preliminares dependen de la muestra
+def view_table(ds: dict, name: str, seg: str | None, key: bytes | None,
+               compute):
+    if key is None:
+        return compute()
+    return cached_aggregate((ds["version"], name, seg, key), compute)
+
+
+# Promediamos las columnas dadas por (Response, segmento) con los códigos
+# precalculados de la segmentación `s`; los segmentos pequeños se agrupan en
+# "Otros" para acotar el número de paneles. Con `weights` (vista preliminar)
+# las medias y las cuotas de segmento son ponderadas
+def seg_means(
+    ds: dict,
+    rows: np.ndarray,
+    values: dict,
+    s: str | None,
+    weights: np.ndarray | None = None,
+) -> pd.DataFrame:
+    segments = ds["segments"]
+    resp = ds["df"]["Response"].to_numpy()[rows]
+    if s is None:
+        codes, labels = np.zeros(rows.size, dtype=np.int32), [None]
+    else:
+        codes, labels = fold_top_k(
+            segments[s][0][rows], segments[s][1], weights=weights
         )
-    ),
-    ui.help_text(
-        ui.tags.span(
-            "Los filtros se aplican a todas las páginas.",
-            style="color:#ffffff;",
+    return group_means(resp, codes, labels, values, s, weights)
+
+
+# Comparamos la tasa de Response por patrón de aceptación de las campañas
+# previas (qué combinaciones de AcceptedCmp1-5 anticipan la respuesta)
+def cmp_patterns_figure(
+    ds: dict,
+    rows: np.ndarray,
+    w: np.ndarray | None = None,
+    key: bytes | None = None,
+):
+    if rows.size == 0:
+        return empty_figure("Sin datos para los filtros actuales")
+
+    # Contamos los 32 patrones × Response en una pasada sobre los códigos
+    # empaquetados (recuentos estimados en la vista preliminar)
+    codes = ds["df"]["Accept_Code"].to_numpy()
+    g = view_table(
+        ds,
+        "fig_cmp_patterns",
+        None,
+        key,
+        lambda: acceptance_patterns(codes[rows], w),
+    )
+
+    fig = table_figure(
+        "fig_cmp_patterns",
+        g[["Patron", "Tasa", "Clientes"]],
+        {"y": "Tasa", "text": "Clientes"},
+        px.bar,
+        style=style_patterns,
+        x="Patron",
+        y="Tasa",
+        text="Clientes",
+        title="Tasa de Response = 1 por campañas previas aceptadas",
+        labels={"Patron": "Campañas aceptadas", "Tasa": "Response = 1"},
+    )
+
+    # Añadimos la tasa global del filtro como referencia
+    rate = float(g["Aceptan"].sum() / g["Clientes"].sum())
+    fig.add_hline(
+        y=rate,
+        line_dash="dot",
+        line_color=PAL["blue"],
+        annotation_text=f"Filtro actual: {rate:.1%}",
+    )
+    return fig
+
+
+# Calculamos el mix de canales como cuotas normalizadas y lo comparamos por
+# Response (y por el segmento `s`)
+def channel_mix_figure(
+    ds: dict,
+    rows: np.ndarray,
+    w: np.ndarray | None = None,
+    s: str | None = None,
+    key: bytes | None = None,
+):
+    if rows.size == 0:
+        return empty_figure("Sin datos para los filtros actuales")
+
+    df = ds["df"]
+    cols = PURCHASE_COLS
+    seg = [s] if s is not None else []
+
+    def table():
+        # Calculamos el total por fila para obtener cuotas relativas por
+        # canal y no depender del volumen completo de compras; descartamos
+        # las filas sin compras antes de extraer las columnas
+        tot = df["TotalPurchases"].to_numpy()[rows]
+        keep = tot > 0
+        r = rows[keep]
+        if r.size == 0:
+            return None
+
+        # Normalizamos la cuota por canal y promediamos las cuotas
+        # individuales por grupo
+        tot = tot[keep]
+        g = seg_means(
+            ds,
+            r,
+            {c: df[c].to_numpy()[r] / tot for c in cols},
+            s,
+            w[keep] if w is not None else None,
         )
-    ),
-    bg=PAL["edge"],
-    fg="#ffffff",
-)
+        g["Response_lbl"] = resp_labels(g["Response"].to_numpy())
+        group_cols = ["Response_lbl"] + seg
+
+        g_long = g.melt(
+            id_vars=group_cols,
+            value_vars=cols,
+            var_name="Canal",
+            value_name="Cuota",
+        )
+
+        map_canal = {
+            "NumWebPurchases": "Web",
+            "NumCatalogPurchases": "Catálogo",
+            "NumStorePurchases": "Tienda",
+        }
+        g_long["Canal"] = g_long["Canal"].map(map_canal)
+        return g_long
+
+    g_long = view_table(ds, "fig_channel_mix", s, key, table)
+    if g_long is None:
+        return empty_figure("Sin compras en los filtros actuales")
+
+    title = "Mix de canales (cuota media, normalizada)"
+    if s is not None:
+        title = f"Mix de canales (cuota media) por {s}"
+
+    # Mostramos el gráfico
+    return table_figure(
+        "fig_channel_mix",
+        g_long,
+        {"y": "Cuota"},
+        px.bar,
+        style=style_mix,
+        x="Response_lbl",
+        y="Cuota",
+        color="Canal",
+        barmode="stack",
+        facet_col=s if s is not None else None,
+        title=title,
+        labels={"Response_lbl": "Respuesta", "Cuota": "Cuota"},
+    )
+
+
+# Calculamos la composición del gasto como cuotas por categoría y la
+# comparamos por Response (y por el segmento `s`)
+def spend_mix_figure(
+    ds: dict,
+    rows: np.ndarray,
+    w: np.ndarray | None = None,
+    s: str | None = None,
+    key: bytes | None = None,
+):
+    if rows.size == 0:
+        return empty_figure("Sin datos para los filtros actuales")
+
+    df = ds["df"]
+    cats = SPEND_COLS
+    seg = [s] if s is not None else []
+
+    def table():
+        tot = df["TotalSpend"].to_numpy()[rows]
+        keep = tot > 0
+        r = rows[keep]
+        if r.size == 0:
+            return None
+
+        # Normalizamos promediamos las cuotas individuales por grupo
+        tot = tot[keep]
+        g = seg_means(
+            ds,
+            r,
+            {c: df[c].to_numpy()[r] / tot for c in cats},
+            s,
+            w[keep] if w is not None else None,
+        )
+        g["Response_lbl"] = resp_labels(g["Response"].to_numpy())
+        group_cols = ["Response_lbl"] + seg
+
+        g_long = g.melt(
+            id_vars=group_cols,
+            value_vars=cats,
+            var_name="Categoria",
+            value_name="Cuota",
+        )
+
+        map_cat = {
+            "MntWines": "Vino",
+            "MntFruits": "Fruta",
+            "MntMeatProducts": "Carne",
+            "MntFishProducts": "Pescado",
+            "MntSweetProducts": "Dulces",
+            "MntGoldProds": "Oro",
+        }
+        g_long["Categoria"] = g_long["Categoria"].map(map_cat)
+        return g_long
+
+    g_long = view_table(ds, "fig_spend_mix", s, key, table)
+    if g_long is None:
+        return empty_figure("Sin gasto en los filtros actuales")
+
+    title = "Composición del gasto (cuota media, normalizada)"
+    if s is not None:
+        title = f"Composición del gasto (cuota media) por {s}"
+
+    # Mostramos el gráfico
+    return table_figure(
+        "fig_spend_mix",
+        g_long,
+        {"y": "Cuota"},
+        px.bar,
+        style=style_mix,
+        x="Response_lbl",
+        y="Cuota",
+        color="Categoria",
+        barmode="stack",
+        facet_col=s if s is not None else None,
+        title=title,
+        labels={"Response_lbl": "Respuesta", "Cuota": "Cuota"},
+    )
+
+
+# Visualizamos la intensidad media de compra por canal y Response (y por el
+# segmento `s`) con un mapa de calor
+def channel_heat_figure(
+    ds: dict,
+    rows: np.ndarray,
+    w: np.ndarray | None = None,
+    s: str | None = None,
+    key: bytes | None = None,
+):
+    if rows.size == 0:
+        return empty_figure("Sin datos para los filtros actuales")
+
+    df = ds["df"]
+    cols = PURCHASE_COLS
+    seg = [s] if s is not None else []
+
+    # Estimamos la intensidad media por canal y grupo para visualizarla como
+    # mapa de calor
+    def table():
+        g = seg_means(ds, rows, {c: df[c].to_numpy()[rows] for c in cols}, s,
+                      w)
+        g["Response_lbl"] = resp_labels(g["Response"].to_numpy())
+        group_cols = ["Response_lbl"] + seg
+
+        g_long = g.melt(
+            id_vars=group_cols,
+            value_vars=cols,
+            var_name="Canal",
+            value_name="Compras_medias",
+        )
+
+        map_canal = {
+            "NumWebPurchases": "Web",
+            "NumCatalogPurchases": "Catálogo",
+            "NumStorePurchases": "Tienda",
+        }
+        g_long["Canal"] = g_long["Canal"].map(map_canal)
+        return g_long
+
+    g_long = view_table(ds, "fig_channel_heat", s, key, table)
+
+    title = "Intensidad de compra por canal (media)"
+    if s is not None:
+        title = f"Intensidad de compra por canal (media) por {s}"
+
+    # Mostramos el gráfico
+    return table_figure(
+        "fig_channel_heat",
+        g_long,
+        {"z": "Compras_medias"},
+        px.density_heatmap,
+        style=style_heat,
+        x="Canal",
+        y="Response_lbl",
+        z="Compras_medias",
+        facet_col=s if s is not None else None,
+        title=title,
+        labels={"Response_lbl": "Respuesta"},
+    )
+
+
+# Representamos la distribución de Income (filas `rows`) con líneas de
+# referencia para media, mediana y p99.5. Fijamos los bordes de las barras en
+# el servidor (xbins) para poder traducir las barras seleccionadas a rangos
+# de Income
+def income_figure(ds: dict, rows: np.ndarray, widget: bool = True):
+    inc = ds["df"]["Income"].to_numpy()[rows]
+    inc = inc[~np.isnan(inc)]
+
+    fig = grouped_figure(
+        "fig_income",
+        pd.DataFrame({"Income": inc}),
+        {"x": "Income"},
+        px.histogram,
+        style=style_income,
+        widget=widget,
+        x="Income",
+        nbins=INCOME_BINS,
+        title="Distribución de Ingresos (Income)",
+        color_discrete_sequence=[PAL["blue"]],
+    )
+
+    # Controlamos el caso sin valores para evitar errores y comunicarlo en
+    # la propia figura
+    if inc.size == 0:
+        fig.add_annotation(
+            x=0.5,
+            y=0.5,
+            xref="paper",
+            yref="paper",
+            text="Sin valores de Ingresos (Income) con los filtros "
+                 "actuales",
+            showarrow=False,
+        )
+        return fig
+
+    p995 = float(np.quantile(inc, 0.995))
+    mean = float(inc.mean())
+    med = float(np.median(inc))
+
+    # Añadimos las referencias (media, mediana y p99.5) a la figura
+    fig.add_vline(x=mean, line_dash="dot",  line_color=PAL["pink2"])
+    fig.add_vline(x=med,  line_dash="dash", line_color=PAL["violet"])
+    fig.add_vline(x=p995, line_dash="dash", line_color=PAL["mag"])
+
+    # Añadimos etiquetas con los valores numéricos correspondientes
+    fig.add_annotation(
+        x=mean,
+        y=1.02,
+        yref="paper",
+        text=f"Media: {mean:,.0f}",
+        showarrow=False,
+        font=dict(color=PAL["pink2"]),
+    )
+    fig.add_annotation(
+        x=med,
+        y=1.08,
+        yref="paper",
+        text=f"Mediana: {med:,.0f}",
+        showarrow=False,
+        font=dict(color=PAL["violet"]),
+    )
+    fig.add_annotation(
+        x=p995,
+        y=1.07,
+        yref="paper",
+        text=f"p99.5: {p995:,.0f}",
+        showarrow=False,
+        font=dict(color=PAL["mag"]),
+    )
+
+    lo, hi = float(inc.min()), float(inc.max())
+    size = (hi - lo) / INCOME_BINS or 1.0
+    fig.update_traces(xbins=dict(start=lo, end=hi, size=size))
+    return fig
+
+
+# Comparamos la distribución de TotalSpend entre Response = 0 y Response = 1
+# mediante un boxplot
+def spend_box_figure(ds: dict, rows: np.ndarray):
+    # Controlamos el caso sin datos para evitar figuras vacías
+    if rows.size == 0:
+        return empty_figure("Sin datos para los filtros actuales")
+
+    # Tomamos solo las dos columnas necesarias y etiquetamos Response a
+    # partir de sus códigos
+    d2 = take_cols(ds["df"], rows, ["Response", "TotalSpend"])
+    d2["Response_lbl"] = resp_labels(
+        d2["Response"].to_numpy(), ["Response = 0", "Response = 1"]
+    )
+
+    # Comparamos la distribución de gasto por grupos con un boxplot
+    return grouped_figure(
+        "fig_spend_box",
+        d2,
+        {"x": "Response_lbl", "y": "TotalSpend"},
+        px.box,
+        group="Response_lbl",
+        style=style_no_legend,
+        x="Response_lbl",
+        y="TotalSpend",
+        points=False,
+        title="Gasto total (TotalSpend) según Response",
+        color="Response_lbl",
+        color_discrete_map={
+            "Response = 0": PAL["blue"],
+            "Response = 1": PAL["mag"],
+        },
+    )
+
+
+# Comparamos las compras medias por canal (web, catálogo, tienda) entre
+# grupos de Response
+def channel_bar_figure(
+    ds: dict,
+    rows: np.ndarray,
+    key: bytes | None = None,
+):
+    if rows.size == 0:
+        return empty_figure("Sin datos para los filtros actuales")
+
+    df = ds["df"]
+    cols = PURCHASE_COLS
+
+    # Estimamos las compras medias por canal y por grupo para comparar los
+    # comportamientos (en la muestra preliminar los pesos son iguales dentro
+    # de cada grupo de Response)
+    def table():
+        d = take_cols(df, rows, ["Response"] + cols)
+        g = d.groupby("Response").mean().reset_index()
+
+        g_long = g.melt(
+            id_vars="Response",
+            value_vars=cols,
+            var_name="Canal",
+            value_name="Compras_medias",
+        )
+
+        # Renombramos los canales para mejorar la legibilidad del gráfico
+        map_canal = {
+            "NumWebPurchases": "Web",
+            "NumCatalogPurchases": "Catálogo",
+            "NumStorePurchases": "Tienda",
+        }
+        g_long["Canal"] = g_long["Canal"].map(map_canal)
+        g_long["Response"] = resp_labels(
+            g_long["Response"].to_numpy(), ["Response = 0", "Response = 1"]
+        )
+        return g_long
+
+    g_long = view_table(ds, "fig_channel_bar", None, key, table)
+
+    # Definimos el gráfico
+    return table_figure(
+        "fig_channel_bar",
+        g_long,
+        {"y": "Compras_medias"},
+        px.bar,
+        x="Canal",
+        y="Compras_medias",
+        color="Response",
+        barmode="group",
+        title="Compras medias por canal según Response",
+        color_discrete_map={
+            "Response = 0": PAL["blue"],
+            "Response = 1": PAL["mag"],
+        },
+    )
+
+
+# Comparamos el gasto medio por categorías (Mnt*) entre los grupos Response
+def cats_bar_figure(
+    ds: dict,
+    rows: np.ndarray,
+    key: bytes | None = None,
+):
+    if rows.size == 0:
+        return empty_figure("Sin datos para los filtros actuales")
+
+    df = ds["df"]
+    cats = SPEND_COLS
+
+    # Comparamos el gasto medio por categoría (Mnt*) entre Response = 0 y
+    # Response = 1
+    def table():
+        d = take_cols(df, rows, ["Response"] + cats)
+        g = d.groupby("Response").mean().reset_index()
+        g_long = g.melt(
+            id_vars="Response",
+            value_vars=cats,
+            var_name="Categoria",
+            value_name="Gasto_medio",
+        )
+
+        # Renombramos las categorías para facilitar la lectura
+        map_cat = {
+            "MntWines": "Vino",
+            "MntFruits": "Fruta",
+            "MntMeatProducts": "Carne",
+            "MntFishProducts": "Pescado",
+            "MntSweetProducts": "Dulces",
+            "MntGoldProds": "Oro",
+        }
+        g_long["Categoria"] = g_long["Categoria"].map(map_cat)
+        g_long["Response"] = resp_labels(
+            g_long["Response"].to_numpy(), ["No aceptan", "Aceptan"]
+        )
+        return g_long
+
+    g_long = view_table(ds, "fig_cats_bar", None, key, table)
+
+    # Mostramos el gráfico
+    return table_figure(
+        "fig_cats_bar",
+        g_long,
+        {"y": "Gasto_medio"},
+        px.bar,
+        x="Categoria",
+        y="Gasto_medio",
+        color="Response",
+        barmode="group",
+        title="Gasto medio por categoría según Response",
+        color_discrete_map={
+            "No aceptan": PAL["blue"],
+            "Aceptan": PAL["mag"],
+        },
+    )
+
+
+# Analizamos la asociación entre Recency y TotalSpend por cada grupo de
+# Response; usamos la escala log en y para tratar la asimetría del gasto
+def recency_spend_figure(ds: dict, rows: np.ndarray, widget: bool = True):
+    if rows.size == 0:
+        return empty_figure("Sin datos para los filtros actuales")
+
+    d2 = take_cols(ds["df"], rows, ["Response", "Recency", "TotalSpend"])
+    d2["Response_lbl"] = resp_labels(d2["Response"].to_numpy())
+
+    return grouped_figure(
+        "fig_recency_spend",
+        d2,
+        {"x": "Recency", "y": "TotalSpend"},
+        px.scatter,
+        group="Response_lbl",
+        style=style_recency_spend,
+        widget=widget,
+        x="Recency",
+        y="TotalSpend",
+        color="Response_lbl",
+        opacity=0.6,
+        title="Relación entre antigüedad de compra y gasto total "
+              "(por respuesta la última campaña)",
+        labels={
+            "Recency": "Días desde la última compra",
+            "TotalSpend": "Gasto total",
+            "Response_lbl": "Respuesta",
+        },
+        color_discrete_map={
+            "No aceptó": PAL["blue"],
+            "Aceptó": PAL["mag"],
+        },
+        log_y=True,
+    )
+
+
+# Representamos la tasa de Response por mes de alta de las filas `rows`
+# dentro del intervalo de meses `span` (por defecto, todos), junto a la
+# referencia de todos los clientes (rollup mensual)
+def cohort_trend_figure(
+    ds: dict,
+    rows: np.ndarray,
+    w: np.ndarray | None = None,
+    span: tuple | None = None,
+    key: bytes | None = None,
+):
+    cohort = ds["cohort"]
+    m = cohort["months"].size
+    i0, i1 = span if span is not None else (0, m)
+    if rows.size == 0 or i0 == i1:
+        return empty_figure("Sin datos para los filtros actuales")
+
+    # Contamos altas y respuestas por mes con los códigos de mes
+    # precomputados (una pasada sobre las filas filtradas; en la vista
+    # preliminar, recuentos ponderados de la muestra)
+    def counts():
+        codes = cohort["code"][rows]
+        keep = codes >= 0
+        codes = codes[keep]
+        resp = ds["df"]["Response"].to_numpy()[rows][keep]
+        wk = None
+        if w is not None:
+            wk = w[keep]
+            resp = resp * wk
+        return (
+            np.bincount(codes, weights=wk, minlength=m),
+            np.bincount(codes, weights=resp, minlength=m),
+        )
+
+    n, n1 = view_table(ds, "fig_cohort_trend", None, key, counts)
+
+    roll = cohort["rollup"].iloc[i0:i1]
+    n_all = (roll["n_0"] + roll["n_1"]).to_numpy()
+    months = roll["month"].to_numpy().astype("datetime64[D]")
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rate = n1[i0:i1] / n[i0:i1]
+        rate_all = roll["n_1"].to_numpy() / n_all
+
+    g = pd.DataFrame({
+        "Mes": np.concatenate([months, months]),
+        "Tasa": np.concatenate([rate, rate_all]),
+        "Serie": ["Filtro actual"] * months.size
+        + ["Todos los clientes"] * months.size,
+    })
+
+    return table_figure(
+        "fig_cohort_trend",
+        g,
+        {"y": "Tasa"},
+        px.line,
+        style=style_rate,
+        x="Mes",
+        y="Tasa",
+        color="Serie",
+        markers=True,
+        title="Tasa de Response = 1 por mes de alta (Dt_Customer)",
+        labels={"Mes": "Mes de alta", "Tasa": "Response = 1"},
+        color_discrete_map={
+            "Filtro actual": PAL["mag"],
+            "Todos los clientes": PAL["blue"],
+        },
+    )
+
+
+# Filas del estado de filtros por defecto (sliders en sus límites y todo el
+# periodo de alta) para una selección de Response
+def default_rows(ds: dict, response: int | None) -> np.ndarray:
+    b = ds["bounds"]
+    return filter_rows(
+        ds["df"],
+        recency=(0, b["recency_max"]),
+        income=(0, b["income_max"]),
+        spend=(0, b["spend_max"]),
+        response=response,
+    )
+
+
+# Definimos las tareas del precálculo de arranque de un dataset con los
+# filtros por defecto: por cada selección de Response, los intervalos de los
+# KPIs, cada figura de la selección (agregados y esqueletos) y, por cada
+# segmentación, las tres vistas de “Patrones de compra”. Cada tarea construye
+# una sola figura, y el hilo de precálculo hace una pausa entre tareas (ver
+# warmup.py). Las figuras con selección gráfica se construyen sin widget:
+# comparten el esqueleto y no abren comunicación con ninguna sesión
+def warmup_tasks(ds: dict) -> list:
+    spend = ds["df"]["TotalSpend"].to_numpy()
+    resp = ds["df"]["Response"].to_numpy()
+
+    def kpis(code):
+        rows = default_rows(ds, code)
+        r = resp[rows]
+        if (r == 0).any() and (r == 1).any():
+            cached_bootstrap(ds["version"], rows, spend, resp)
+
+    def figure(code, build, keyed=True, **kw):
+        rows = default_rows(ds, code)
+        if keyed:
+            kw["key"] = rows_digest(rows)
+        build(ds, rows, **kw)
+
+    tasks = []
+    for label, code in RESPONSE_CODES.items():
+        tasks.append((f"kpis/{label}", partial(kpis, code)))
+        for build in (cmp_patterns_figure, channel_bar_figure,
+                      cats_bar_figure, cohort_trend_figure):
+            tasks.append((f"{build.__name__}/{label}",
+                          partial(figure, code, build)))
+        tasks.append((f"spend_box_figure/{label}",
+                      partial(figure, code, spend_box_figure, keyed=False)))
+        for build in (income_figure, recency_spend_figure):
+            tasks.append((f"{build.__name__}/{label}",
+                          partial(figure, code, build, keyed=False,
+                                  widget=False)))
+        for s in [None] + list(ds["segments"]):
+            for build in (channel_mix_figure, spend_mix_figure,
+                          channel_heat_figure):
+                tasks.append((
+                    f"{build.__name__}/{s or 'Sin segmentación'}/{label}",
+                    partial(figure, code, build, s=s),
+                ))
+    return tasks
+
+
+# Cargamos el dataset por defecto al arrancar (los demás se cargan al abrir
+# la primera sesión que los pide). Cada dataset incluye sus umbrales robustos
+# (p99.5), los índices de brushing, cohortes y segmentación, y los límites de
+# los sliders (ver datasets.py). Cada dataset cargado lanza su precálculo en
+# segundo plano (ver warmup.py)
+on_load(lambda ds: start_warmup(ds["name"], warmup_tasks(ds)))
+get_dataset(DEFAULT_DATASET)
+
+# Construimos la barra lateral con filtros globales que afectan a todas las
+# pestañas; los límites de los sliders dependen del dataset de la sesión
+def build_sidebar(ds: dict):
+    b = ds["bounds"]
+    return ui.sidebar(
+        ui.h4(
+            "Filtros globales",
+            style="margin-bottom:-10px;",
+        ),
+        ui.hr(
+            style="margin-top:0px; margin-bottom:0px;",
+        ),
+        ui.input_slider(
+            "recency",
+            "Días desde la última compra",
+            0,
+            b["recency_max"],
+            value=(0, b["recency_max"]),
+        ),
+        ui.input_slider(
+            "income",
+            "Rango de ingresos (Income)",
+            0,
+            b["income_max"],
+            value=(0, b["income_max"]),
+        ),
+        ui.input_select(
+            "response",
+            "Respuesta a la última campaña (Response)",
+            choices=["Todas", "No aceptó (0)", "Aceptó (1)"],
+            selected="Todas",
+        ),
+        ui.input_slider(
+            "cohort",
+            "Periodo de alta (Dt_Customer)",
+            b["cohort_min"],
+            b["cohort_max"],
+            value=(b["cohort_min"], b["cohort_max"]),
+            time_format="%m/%Y",
+        ),
+        ui.output_ui("cohort_text"),
+        ui.input_action_button(
+            "reset",
+            "Restablecer filtros",
+            class_="btn-light",
+        ),
+        ui.hr(
+            style="margin-top:0px; margin-bottom:0px;",
+        ),
+        ui.h5("Resumen del filtro"),
+        ui.output_ui("kpi_text"),
+        ui.help_text(
+            ui.tags.span(
+                f"Dataset: {ds['name']}",
+                style="color:#ffffff;",
+            )
+        ) if len(DATASETS) > 1 else None,
+        ui.help_text(
+            ui.tags.span(
+                ui.tags.span("Response: "),
+                ui.tags.br(),
+                ui.tags.span("1 = aceptó la última campaña."),
+                ui.tags.br(),
+                ui.tags.span("0 = no aceptó."),
+                style="color:#ffffff;line-height:1.1;",
+            )
+        ),
+        ui.help_text(
+            ui.tags.span(
+                "Los filtros se aplican a todas las páginas.",
+                style="color:#ffffff;",
+            )
+        ),
+        ui.help_text(
+            ui.tags.span(
+                "Seleccionar puntos (gasto vs. recencia) o barras (ingresos) "
+                "filtra el resto de vistas; «Restablecer filtros» elimina la "
+                "selección.",
+                style="color:#ffffff;",
+            )
+        ),
+        bg=PAL["edge"],
+        fg="#ffffff",
+    )
+
 
 # Definimos el encabezado de la aplicación
 title_ui = ui.tags.div(
@@ -110,188 +938,412 @@ title_ui = ui.tags.div(
 )
 
 # Definimos la navegación por pestañas y el contenido principal de la app
-app_ui = ui.page_navbar(
-    ui.nav_panel(
-        "Contexto y preguntas",
-        ui.h3("Contexto, preguntas y objetivos"),
-        ui.h4("Descripción del conjunto de datos"),
-        ui.output_text("facts_text"),
-        ui.hr(),
-        ui.h4("Variables clave"),
-        ui.output_ui("vars_text"),
-        ui.hr(),
-        output_widget("fig_income"),
-        ui.output_ui("income_note"),
-        ui.hr(),
-        ui.h4("Preguntas y objetivos"),
-        ui.tags.ul(
-            ui.tags.li(
-                "¿Cómo varía Response según el gasto total y el número de "
-                "días desde la última compra?"
+# para el dataset dado
+def build_page(ds: dict):
+    b = ds["bounds"]
+    return ui.page_navbar(
+        ui.nav_panel(
+            "Contexto y preguntas",
+            ui.h3("Contexto, preguntas y objetivos"),
+            ui.h4("Descripción del conjunto de datos"),
+            ui.output_text("facts_text"),
+            ui.hr(),
+            ui.h4("Variables clave"),
+            ui.output_ui("vars_text"),
+            ui.hr(),
+            output_widget("fig_income"),
+            ui.output_ui("income_note"),
+            ui.hr(),
+            ui.h4("Preguntas y objetivos"),
+            ui.tags.ul(
+                ui.tags.li(
+                    "¿Cómo varía Response según el gasto total y el número de "
+                    "días desde la última compra?"
+                ),
+                ui.tags.li(
+                    "¿Cómo difieren los canales entre Response = 0 y 1?"
+                ),
+                ui.tags.li(
+                    "¿Qué categorías de gasto distinguen ambos grupos?"
+                ),
             ),
-            ui.tags.li(
-                "¿Cómo difieren los canales entre Response = 0 y 1?"
+            ui.p(
+                "Objetivo: identificar patrones y diferencias entre grupos a "
+                "partir de los datos, interpretándolos como asociaciones "
+                "descriptivas y no como efectos causales, y permitir la "
+                "exploración interactiva mediante filtros."
             ),
-            ui.tags.li(
-                "¿Qué categorías de gasto distinguen ambos grupos?"
+            ui.hr(),
+            ui.h4("Decisiones y limitaciones"),
+            ui.p(
+                "Los resultados se presentan de forma agregada para reducir "
+                "riesgos de reidentificación. La muestra procede de un "
+                "contexto empresarial específico (representatividad no "
+                "garantizada) y la interpretación es descriptiva, sin inferir "
+                "causalidad."
+            ),
+            ui.p(
+                "El recorte visual p99.5 se emplea únicamente para mejorar la "
+                "legibilidad y no elimina observaciones del conjunto de datos."
+            ),
+            ui.hr(),
+            ui.h4("Uso de la visualización"),
+            ui.p(
+                "Los filtros globales modifican todas las vistas y permiten "
+                "explorar cómo cambian los patrones por días desde la última "
+                "compra, ingresos y su respuesta."
             ),
         ),
-        ui.p(
-            "Objetivo: identificar patrones y diferencias entre grupos a "
-            "partir de los datos, interpretándolos como asociaciones "
-            "descriptivas y no como efectos causales, y permitir la "
-            "exploración interactiva mediante filtros."
-        ),
-        ui.hr(),
-        ui.h4("Decisiones y limitaciones"),
-        ui.p(
-            "Los resultados se presentan de forma agregada para reducir "
-            "riesgos de reidentificación. La muestra procede de un contexto "
-            "empresarial específico (representatividad no garantizada) y la "
-            "interpretación es descriptiva, sin inferir causalidad."
-        ),
-        ui.p(
-            "El recorte visual p99.5 se emplea únicamente para mejorar "
-            "la legibilidad y no elimina observaciones del conjunto de datos."
-        ),
-        ui.hr(),
-        ui.h4("Uso de la visualización"),
-        ui.p(
-            "Los filtros globales modifican todas las vistas y permiten "
-            "explorar cómo cambian los patrones por días desde la última "
-            "compra, ingresos y su respuesta."
-        ),
-    ),
-    ui.nav_panel(
-        "Respuesta a campañas",
-        ui.h3("Respuesta a campañas (Response)"),
-        ui.output_ui("kpi_campaigns"),
-        ui.hr(),
-        ui.h5("Filtro de rango de gasto total"),
-        ui.input_slider(
-            "spend_range",
-            "Rango de gasto total (TotalSpend)",
-            0,
-            int(df["TotalSpend"].max()),
-            value=(0, int(df["TotalSpend"].max())),
-        ),
-        ui.layout_columns(
-            output_widget("fig_spend_box"),
-            output_widget("fig_channel_bar"),
-            col_widths=(6, 6),
-        ),
-        ui.hr(),
-        output_widget("fig_cats_bar"),
-        output_widget("fig_recency_spend"),
-    ),
-    ui.nav_panel(
-        "Patrones de compra",
-        ui.h3("Patrones de compra: canales y estructura del gasto"),
-        ui.p(
-            "Las siguientes vistas describen la composición relativa de "
-            "compras y gasto. La normalización a porcentaje facilita la "
-            "comparación entre grupos, independientemente del nivel de gasto."
-        ),
-        ui.input_select(
-            "seg_var",
-            "Segmentación (opcional)",
-            choices=[
-                "Sin segmentación",
-                "Nivel educativo",
-                "Estado civil",
-                "Menores en el hogar",
-            ],
-            selected="Sin segmentación",
+        ui.nav_panel(
+            "Respuesta a campañas",
+            ui.h3("Respuesta a campañas (Response)"),
+            ui.output_ui("kpi_campaigns"),
+            ui.hr(),
+            ui.h5("Filtro de rango de gasto total"),
+            ui.input_slider(
+                "spend_range",
+                "Rango de gasto total (TotalSpend)",
+                0,
+                b["spend_max"],
+                value=(0, b["spend_max"]),
+            ),
+            ui.layout_columns(
+                output_widget("fig_spend_box"),
+                output_widget("fig_channel_bar"),
+                col_widths=(6, 6),
+            ),
+            ui.hr(),
+            output_widget("fig_cats_bar"),
+            output_widget("fig_recency_spend"),
+            ui.hr(),
+            output_widget("fig_cohort_trend"),
+            ui.hr(),
+            output_widget("fig_cmp_patterns"),
         ),
-        output_widget("fig_channel_mix"),
-        ui.hr(),
-        output_widget("fig_spend_mix"),
-        ui.hr(),
-        output_widget("fig_channel_heat"),
-    ),
-    ui.nav_panel(
-        "Conclusiones",
-        ui.h3("Conclusiones y aprendizajes"),
-        ui.p(
-            "Síntesis final basada en las vistas anteriores. El resumen se "
-            "actualiza con los filtros globales."
+        ui.nav_panel(
+            "Patrones de compra",
+            ui.h3("Patrones de compra: canales y estructura del gasto"),
+            ui.p(
+                "Las siguientes vistas describen la composición relativa de "
+                "compras y gasto. La normalización a porcentaje facilita la "
+                "comparación entre grupos, independientemente del nivel de "
+                "gasto."
+            ),
+            ui.input_select(
+                "seg_var",
+                "Segmentación (opcional)",
+                choices=[
+                    "Sin segmentación",
+                    "Nivel educativo",
+                    "Estado civil",
+                    "Menores en el hogar",
+                    "Década de nacimiento",
+                    "Decil de ingresos",
+                    "Edad al alta (tramos)",
+                ] + (["Clúster"] if "Cluster" in ds["segments"] else []),
+                selected="Sin segmentación",
+            ),
+            output_widget("fig_channel_mix"),
+            ui.hr(),
+            output_widget("fig_spend_mix"),
+            ui.hr(),
+            output_widget("fig_channel_heat"),
         ),
-        ui.h4("Resumen con filtros actuales"),
-        ui.output_ui("concl_kpis"),
-        ui.hr(),
-        ui.h4("¿Qué he aprendido del conjunto de datos?"),
-        ui.p(
-            "El conjunto de datos combina variables sociodemográficas y "
-            "comportamentales, lo que permite describir perfiles de compra y "
-            "su relación con la aceptación de campañas. La distribución de "
-            "ingresos y del gasto es asimétrica, por lo que conviene emplear "
-            "medidas robustas y visualizaciones que controlen los valores "
-            "extremos."
+        ui.nav_panel(
+            "Clientes similares",
+            ui.h3("Clientes similares"),
+            ui.p(
+                "Buscamos los clientes más parecidos al indicado según "
+                "ingresos, gasto total, recencia, compras por canal y cuotas "
+                "de gasto por categoría (variables estandarizadas)."
+            ),
+            ui.layout_columns(
+                ui.input_numeric(
+                    "sim_id",
+                    "ID de cliente",
+                    value=int(ds["df"]["ID"].iloc[0]),
+                ),
+                ui.input_numeric(
+                    "sim_k",
+                    "Número de clientes similares",
+                    value=10,
+                    min=1,
+                    max=100,
+                ),
+                ui.input_checkbox(
+                    "sim_filtered",
+                    "Buscar solo entre los clientes del filtro actual",
+                    value=False,
+                ),
+                col_widths=(4, 4, 4),
+            ),
+            ui.output_ui("sim_summary"),
+            ui.output_data_frame("sim_table"),
         ),
-        ui.h4("¿Qué he aprendido de las visualizaciones propuestas?"),
-        ui.p(
-            "Las comparaciones por grupos (Response) son más interpretables "
-            "al combinar una magnitud (como el gasto) con una estructura (mix "
-            "de canales y categorías). La normalización a porcentajes "
-            "facilita identificar patrones de composición sin confundirlos "
-            "con el volumen total."
+        ui.nav_panel(
+            "Conclusiones",
+            ui.h3("Conclusiones y aprendizajes"),
+            ui.p(
+                "Síntesis final basada en las vistas anteriores. El resumen "
+                "se actualiza con los filtros globales."
+            ),
+            ui.h4("Resumen con filtros actuales"),
+            ui.output_ui("concl_kpis"),
+            ui.hr(),
+            ui.h4("Exportar los clientes filtrados"),
+            ui.layout_columns(
+                ui.input_selectize(
+                    "export_cols",
+                    "Columnas (vacío = todas)",
+                    choices=list(ds["df"].columns),
+                    multiple=True,
+                ),
+                ui.input_radio_buttons(
+                    "export_fmt",
+                    "Formato",
+                    choices=(
+                        {"csv": "CSV", "parquet": "Parquet"}
+                        if HAS_PARQUET else {"csv": "CSV"}
+                    ),
+                    selected="csv",
+                    inline=True,
+                ),
+                ui.download_button(
+                    "export_rows",
+                    "Descargar",
+                    class_="btn-light",
+                ),
+                col_widths=(6, 3, 3),
+            ),
+            ui.hr(),
+            ui.h4("¿Qué he aprendido del conjunto de datos?"),
+            ui.p(
+                "El conjunto de datos combina variables sociodemográficas y "
+                "comportamentales, lo que permite describir perfiles de "
+                "compra y su relación con la aceptación de campañas. La "
+                "distribución de ingresos y del gasto es asimétrica, por lo "
+                "que conviene emplear medidas robustas y visualizaciones que "
+                "controlen los valores extremos."
+            ),
+            ui.h4("¿Qué he aprendido de las visualizaciones propuestas?"),
+            ui.p(
+                "Las comparaciones por grupos (Response) son más "
+                "interpretables al combinar una magnitud (como el gasto) con "
+                "una estructura (mix de canales y categorías). La "
+                "normalización a porcentajes facilita identificar patrones de "
+                "composición sin confundirlos con el volumen total."
+            ),
+            ui.h4("¿Qué he aprendido durante el proceso de visualización?"),
+            ui.p(
+                "El diseño interactivo requiere equilibrar la expresividad y "
+                "elrendimiento. Para ello se utilizan filtros globales, la "
+                "segmentación y escalas adecuadas, que mejoran la exploración "
+                "sin sobrecargar la interfaz. Además, la consistencia visual "
+                "(la paleta de colores, la tipografía y la jerarquía) aumenta "
+                "la claridad del relato y facilita la interpretación de los "
+                "datos."
+            ),
         ),
-        ui.h4("¿Qué he aprendido durante el proceso de visualización?"),
-        ui.p(
-            "El diseño interactivo requiere equilibrar la expresividad y el"
-            "rendimiento. Para ello se utilizan filtros globales, la "
-            "segmentación y escalas adecuadas, que mejoran la exploración sin "
-            "sobrecargar la interfaz. Además, la consistencia visual (la "
-            "paleta de colores, la tipografía y la jerarquía) aumenta la "
-            "claridad del relato y facilita la interpretación de los datos."
+        title=title_ui,
+        id="nav",
+        sidebar=build_sidebar(ds),
+        navbar_options=ui.navbar_options(
+            theme="dark",
+            bg=PAL["pink2"],
         ),
-    ),
-    title=title_ui,
-    id="nav",
-    sidebar=sidebar,
-    navbar_options=ui.navbar_options(
-        theme="dark",
-        bg=PAL["pink2"],
-    ),
-)
+    )
+
+
+# Construimos la interfaz en cada petición con los límites del dataset
+# indicado en la URL (?dataset=<nombre>)
+def app_ui(request):
+    return build_page(get_dataset(dataset_from_query(request.url.query)))
+
+
+# Cargamos en un hilo el dataset de la URL antes de servir la página: Shiny
+# llama a app_ui y a server de forma síncrona en el bucle de eventos, así que
+# la primera petición de una marca congelaría todas las sesiones mientras se
+# construyen sus índices. Con el dataset ya en el registro, app_ui y la
+# sesión que abre la página solo hacen la consulta
+def preload_dataset(shiny_app):
+    async def asgi(scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/":
+            query = scope.get("query_string", b"").decode("latin-1")
+            await asyncio.to_thread(get_dataset, dataset_from_query(query))
+        await shiny_app(scope, receive, send)
+
+    return asgi
 
 
 # Definimos la lógica  del servidor: aquí aplicamos los filtros,
 # calculamos los KPIs y generamos las figuras
 def server(input, output, session):
+    # Tomamos el dataset indicado en la URL al abrir la sesión; la sesión
+    # conserva su referencia aunque el registro lo expulse
+    search_id = ".clientdata_url_search"
+    with reactive.isolate():
+        search = (input[search_id]() or "") if search_id in input else ""
+    ds = get_dataset(dataset_from_query(search))
+    df = ds["df"]
+    row_index, cohort, segments = ds["row_index"], ds["cohort"], ds["segments"]
+
+    # Guardamos la selección gráfica (brushing) de cada vista como un array
+    # ordenado de identificadores de fila (None si no hay selección)
+    brushes = {src: reactive.value(None) for src in BRUSH_SOURCES}
+
+    # Etiquetamos los perfiles con el estado de los filtros (las selecciones
+    # gráficas se resumen por su número de filas)
+    def profile_state() -> dict:
+        state = {
+            k: input[k]()
+            for k in ("recency", "income", "response", "cohort",
+                      "spend_range", "seg_var")
+        }
+        state["dataset"] = ds["name"]
+        for src in BRUSH_SOURCES:
+            ids = brushes[src]()
+            state[src] = None if ids is None else int(ids.size)
+        return state
+
+    # Activamos la captura de perfiles si la sesión lo solicita (variable de
+    # entorno o parámetro de administración en la URL)
+    attach_profiling(session, profile_state)
+
+    @reactive.calc
+    # Traducimos el periodo de alta seleccionado a un intervalo [i0, i1) de
+    # meses del índice de cohortes
+    def cohort_sel():
+        return cohort_span(cohort, *input.cohort())
+
     @reactive.calc
-    # Construimos el DataFrame filtrado que actúa como fuente  para todas las
+    # Construimos la selección de filas de los filtros de la barra lateral
+    # (posiciones sobre las columnas compartidas de df)
+    def base_rows():
+        # Convertimos la selección de Response a un código de filtrado
+        # (None si es “Todas”)
+        resp = RESPONSE_CODES.get(input.response())
+
+        # Si el periodo de alta no cubre todos los meses, partimos de las
+        # filas de la cohorte (un tramo contiguo del índice ordenado)
+        i0, i1 = cohort_sel()
+        rows = None
+        if (i0, i1) != (0, cohort["months"].size):
+            rows = cohort_rows(cohort, i0, i1)
+
+        # Aplicamos los filtros globales (recency e income) y el específico de
+        # la pestaña “Respuesta a campañas” (rango de gasto total)
+        return filter_rows(
+            df,
+            recency=input.recency(),
+            income=input.income(),
+            spend=input.spend_range(),
+            response=resp,
+            rows=rows,
+        )
+
+    # Intersectamos las filas con las selecciones gráficas de las vistas
+    # indicadas; cada vista origen ignora su propia selección para poder
+    # seguir mostrando (y reseleccionando) todos sus puntos
+    def brushed(rows, sources=BRUSH_SOURCES):
+        for src in sources:
+            ids = brushes[src]()
+            if ids is not None:
+                rows = intersect_rows(rows, ids)
+        return rows
+
+    @reactive.calc
+    @traced
+    # Construimos la selección final que actúa como fuente para todas las
     # vistas y KPIs
     def df_f():
-        # Aplicamos los filtros globales (recency e income) sobre el DataFrame
-        r0, r1 = input.recency()
-        i0, i1 = input.income()
+        return brushed(base_rows())
 
-        d = df[(df["Recency"] >= r0) & (df["Recency"] <= r1)]
-        d = d[
-            d["Income"].isna()
-            | ((d["Income"] >= i0) & (d["Income"] <= i1))
-        ]
+    # Calculamos los intervalos bootstrap de los KPIs una vez por estado de
+    # filtro y los compartimos entre el resumen y las conclusiones
+    @reactive.calc
+    def kpi_ci():
+        return cached_bootstrap(
+            ds["version"],
+            df_f(),
+            df["TotalSpend"].to_numpy(),
+            df["Response"].to_numpy(),
+        )
 
-        # Aplicamos el filtro específico de la pestaña “Respuesta a campañas”
-        # (rango de gasto total)
-        s0, s1 = input.spend_range()
-        d = d[(d["TotalSpend"] >= s0) & (d["TotalSpend"] <= s1)]
+    # Vista progresiva: si el filtro deja muchas filas, las pestañas
+    # “Respuesta a campañas” y “Patrones de compra” se dibujan primero sobre
+    # una muestra estratificada precalculada y, una vez enviadas, se
+    # recalculan con todas las filas. Guardamos la selección ya refinada
+    refined = reactive.value(None)
 
-        # Convertimos la selección de Response a una condición de filtrado
-        # (si no es “Todas”)
-        sel = input.response()
+    @reactive.calc
+    # Indicamos si la selección actual se muestra como preliminar
+    def preview():
+        rows = df_f()
+        return (
+            bool(ds["samples"])
+            and rows.size > PROGRESSIVE_ROWS
+            and refined() is not rows
+        )
 
-        if sel == "No aceptó (0)":
-            d = d[d["Response"] == 0]
+    # Restringimos las filas a la muestra de la vista preliminar (la
+    # estratificada por Response o la de la segmentación `seg`) y devolvemos
+    # también sus pesos; en la vista exacta, las filas sin pesos
+    def thin(rows: np.ndarray, seg: str | None = None) -> tuple:
+        if not preview():
+            return rows, None
+        return sample_rows(rows, ds["samples"][seg])
 
-        if sel == "Aceptó (1)":
-            d = d[d["Response"] == 1]
+    @reactive.calc
+    # Identificamos el estado de filtro por la huella de sus filas (clave de
+    # la caché de agregados compartida con otras sesiones y el precálculo)
+    def rows_key():
+        return rows_digest(df_f())
 
-        return d
+    # Clave de caché de una vista: solo para las vistas exactas (sin pesos)
+    def agg_key(w: np.ndarray | None) -> bytes | None:
+        return rows_key() if w is None else None
+
+    @reactive.calc
+    @traced
+    # Filas (y pesos) de las vistas por Response
+    def view():
+        return thin(df_f())
+
+    @reactive.calc
+    @traced
+    # Filas (y pesos) de las vistas por segmento de “Patrones de compra”
+    def seg_view():
+        return thin(df_f(), seg_col())
+
+    # Calculamos la vista exacta de una selección cuando le llega el turno;
+    # si entretanto los filtros han cambiado, la descartamos
+    async def refine(rows: np.ndarray):
+        async with reactive.lock():
+            with session_context(session), reactive.isolate():
+                if df_f() is not rows:
+                    return
+                refined.set(rows)
+            await reactive.flush()
+
+    refining = set()
+
+    @reactive.effect
+    # Tras enviar una vista preliminar, programamos su refinamiento
+    def _schedule_refine():
+        rows = df_f()
+        if not preview():
+            return
+
+        def start():
+            task = asyncio.create_task(refine(rows))
+            refining.add(task)
+            task.add_done_callback(refining.discard)
+
+        session.on_flushed(start, once=True)
 
     @output
     @render.text
+    @traced
     # Generamos un resumen descriptivo del dataset (tamaño, missing de Income,
     # tasa base de Response y rango temporal)
     def facts_text():
@@ -310,6 +1362,7 @@ def server(input, output, session):
 
     @output
     @render.ui
+    @traced
     # Mostramos una definición de las variables para facilitar la
     # interpretación de las gráficas
     def vars_text():
@@ -333,6 +1386,7 @@ def server(input, output, session):
 
     @output
     @render.ui
+    @traced
     # Añadimos una nota sobre Income
     def income_note():
         # Aclaramos que el p99.5 se usa como referencia visual y no como
@@ -347,99 +1401,68 @@ def server(input, output, session):
 
     @output
     @render_widget
+    @traced
     # Representamos la distribución de Income y añadimos las referencias
     # con los filtros activos
     def fig_income():
-        d = df_f()
-
-        # Visualizamos la distribución de Income con un histograma y líneas de
-        # referencia para media, mediana y p99.5
-        fig = px.histogram(
-            d,
-            x="Income",
-            nbins=45,
-            title="Distribución de Ingresos (Income)",
-            color_discrete_sequence=[PAL["blue"]],
-        )
-        fig.update_traces(marker_line_color=PAL["edge"])
-
-        inc = d["Income"].dropna()
-
-        # Controlamos el caso sin valores para evitar errores y comunicarlo en
-        # la propia figura
-        if inc.empty:
-            fig.add_annotation(
-                x=0.5,
-                y=0.5,
-                xref="paper",
-                yref="paper",
-                text="Sin valores de Ingresos (Income) con los filtros "
-                     "actuales",
-                showarrow=False,
-            )
-            return fig
-
-        p995 = float(inc.quantile(0.995))
-        mean = float(inc.mean())
-        med = float(inc.median())
-
-        # Añadimos las referencias (media, mediana y p99.5) a la figura
-        fig.add_vline(x=mean, line_dash="dot",  line_color=PAL["pink2"])
-        fig.add_vline(x=med,  line_dash="dash", line_color=PAL["violet"])
-        fig.add_vline(x=p995, line_dash="dash", line_color=PAL["mag"])
-
-        # Añadimos etiquetas con los valores numéricos correspondientes
-        fig.add_annotation(
-            x=mean,
-            y=1.02,
-            yref="paper",
-            text=f"Media: {mean:,.0f}",
-            showarrow=False,
-            font=dict(color=PAL["pink2"]),
-        )
-        fig.add_annotation(
-            x=med,
-            y=1.08,
-            yref="paper",
-            text=f"Mediana: {med:,.0f}",
-            showarrow=False,
-            font=dict(color=PAL["violet"]),
-        )
-        fig.add_annotation(
-            x=p995,
-            y=1.07,
-            yref="paper",
-            text=f"p99.5: {p995:,.0f}",
-            showarrow=False,
-            font=dict(color=PAL["mag"]),
+        fig = income_figure(
+            ds, brushed(base_rows(), ["fig_recency_spend"])
         )
 
+        # Convertimos las barras seleccionadas en sus filas mediante el
+        # índice ordenado de Income (búsqueda binaria por barra, sin recorrer
+        # el dataset) con los bordes fijados en la figura
+        def on_select(trace, points, selector):
+            brushes["fig_income"].set(rows_in_bins(
+                row_index,
+                "Income",
+                points.xs,
+                trace.xbins.start,
+                trace.xbins.size,
+                INCOME_BINS,
+            ))
+
+        def on_click(trace, points, state):
+            on_select(trace, points, None)
+
+        def on_deselect(trace, points):
+            brushes["fig_income"].set(None)
+
+        fig.data[0].on_selection(on_select)
+        fig.data[0].on_click(on_click)
+        fig.data[0].on_deselect(on_deselect)
         return fig
 
     @output
     @render.ui
+    @traced
     # Calculamos un resumen de la campaña con los filtros actuales (tasa
     # Response = 1 y la diferencia de mediana de gasto entre grupos)
     def kpi_campaigns():
-        d = df_f()
+        rows = df_f()
 
         # Si el filtrado deja el conjunto vacío, lo reportamos explícitamente
-        if d.empty:
+        if rows.size == 0:
             return ui.tags.p(
                 "Sin datos con los filtros actuales.",
                 style="margin:0;",
             )
 
         # Generamos un resumen general del tamaño de la muestra filtrado y la
-        # tasa de aceptación de la última campaña
-        n = int(len(d))
-        rate = 100.0 * float(d["Response"].mean())
-
-        # Comparamos el gasto total entre grupos mediante la mediana
-        d0 = d.loc[d["Response"] == 0, "TotalSpend"].dropna()
-        d1 = d.loc[d["Response"] == 1, "TotalSpend"].dropna()
-
-        if d0.empty or d1.empty:
+        # tasa de aceptación de la última campaña (siempre exactos)
+        n = int(rows.size)
+        rate = 100.0 * float(df["Response"].to_numpy()[rows].mean())
+
+        # Comparamos el gasto total entre grupos mediante la mediana; en la
+        # vista preliminar, sobre la muestra (estratificada por Response, así
+        # que los pesos son iguales dentro de cada grupo)
+        v_rows, _ = view()
+        resp = df["Response"].to_numpy()[v_rows]
+        spend = df["TotalSpend"].to_numpy()[v_rows]
+        d0 = spend[resp == 0]
+        d1 = spend[resp == 1]
+
+        if d0.size == 0 or d1.size == 0:
             txt = (
                 f"Registros (filtrados): {n} | "
                 f"Tasa Response = 1: {rate:.2f}% | "
@@ -447,17 +1470,45 @@ def server(input, output, session):
             )
             return ui.tags.p(txt, style="margin:0;")
 
-        med0 = float(d0.median())
-        med1 = float(d1.median())
+        med0 = float(np.median(d0))
+        med1 = float(np.median(d1))
         delta = med1 - med0
 
+        # En la vista preliminar dejamos los intervalos para el refinamiento
+        if preview():
+            txt = (
+                f"Registros (filtrados): {n} | "
+                f"Tasa Response = 1: {rate:.2f}% | "
+                f"Mediana TotalSpend (0): {med0:,.0f} | "
+                f"Mediana TotalSpend (1): {med1:,.0f} | "
+                f"Diferencia de gasto (1-0): {delta:,.0f} "
+                f"(preliminar: muestra de {v_rows.size} filas)"
+            )
+            return ui.tags.p(
+                txt,
+                style=(
+                    "margin:0;"
+                    "padding:0.25rem 0.5rem;"
+                    "border-left:4px dashed " + PAL["pink"] + ";"
+                    "background:rgba(0,0,0,0.03);"
+                ),
+            )
+
+        # Acompañamos la tasa y la diferencia con su intervalo bootstrap
+        ci = kpi_ci()
+        r_lo, r_hi = (100.0 * x for x in ci["rate_ci"])
+        d_lo, d_hi = ci["diff_ci"]
+
         # Mostramos el resumen calculado
         txt = (
             f"Registros (filtrados): {n} | "
-            f"Tasa Response = 1: {rate:.2f}% | "
+            f"Tasa Response = 1: {rate:.2f}% "
+            f"(IC 95%: {r_lo:.2f}–{r_hi:.2f}%) | "
             f"Mediana TotalSpend (0): {med0:,.0f} | "
             f"Mediana TotalSpend (1): {med1:,.0f} | "
-            f"Diferencia de gasto (1-0): {delta:,.0f}"
+            f"Diferencia de gasto (1-0): {delta:,.0f} "
+            f"(IC 95%: {d_lo:,.0f} a {d_hi:,.0f}; "
+            f"{ci['n_boot']} remuestreos)"
         )
 
         # Definimos el estilo básico del bloque de texto
@@ -473,189 +1524,210 @@ def server(input, output, session):
 
     @output
     @render_widget
+    @traced
     # Comparamos la distribución de TotalSpend entre Response = 0 y
     # Response = 1 mediante un boxplot
     def fig_spend_box():
-        d = df_f()
-        # Controlamos el caso sin datos para evitar figuras vacías
-        if len(d) == 0:
-            return px.scatter(title="Sin datos para los filtros actuales")
-
-        d2 = d.copy()
-        d2["Response_lbl"] = d2["Response"].map(
-            {0: "Response = 0", 1: "Response = 1"}
-        )
-
-        # Comparamos la distribución de gasto por grupos con un boxplot
-        fig = px.box(
-            d2,
-            x="Response_lbl",
-            y="TotalSpend",
-            points=False,
-            title="Gasto total (TotalSpend) según Response",
-            color="Response_lbl",
-            color_discrete_map={
-                "Response = 0": PAL["blue"],
-                "Response = 1": PAL["mag"],
-            },
-        )
-        fig.update_layout(showlegend=False)
-        return fig
+        rows, _ = view()
+        fig = spend_box_figure(ds, rows)
+        return mark_preliminary(fig) if preview() else fig
 
     @output
     @render_widget
+    @traced
     # Comparamos las compras medias por canal (web, catálogo, tienda) entre
     # grupos de Response
     def fig_channel_bar():
         try:
-            d = df_f()
-            if d.empty:
-                return px.scatter(title="Sin datos para los filtros actuales")
-
-            # Estimamos las compras medias por canal y por grupo para comparar
-            # los comportamientos
-            cols = ["NumWebPurchases", "NumCatalogPurchases",
-                    "NumStorePurchases"]
-            g = d[["Response"] + cols].groupby("Response").mean().reset_index()
-
-            g_long = g.melt(
-                id_vars="Response",
-                value_vars=cols,
-                var_name="Canal",
-                value_name="Compras_medias",
-            )
-
-            # Renombramos los canales para mejorar la legibilidad del gráfico
-            map_canal = {
-                "NumWebPurchases": "Web",
-                "NumCatalogPurchases": "Catálogo",
-                "NumStorePurchases": "Tienda",
-            }
-            g_long["Canal"] = g_long["Canal"].map(map_canal)
-            g_long["Response"] = g_long["Response"].map(
-                {0: "Response = 0", 1: "Response = 1"}
-            )
-
-            # Definimos el gráfico
-            fig = px.bar(
-                g_long,
-                x="Canal",
-                y="Compras_medias",
-                color="Response",
-                barmode="group",
-                title="Compras medias por canal según Response",
-                color_discrete_map={
-                    "Response = 0": PAL["blue"],
-                    "Response = 1": PAL["mag"],
-                },
-            )
-            return fig
+            rows, w = view()
+            fig = channel_bar_figure(ds, rows, agg_key(w))
+            return mark_preliminary(fig) if preview() else fig
 
         except Exception as e:
             # Reportamos errores en stderr para la depuración sin romper la app
             print(f"ERROR fig_channel_bar: {e}", file=sys.stderr)
-            return px.scatter(title=f"Error en fig_channel_bar: {e}")
+            return empty_figure(f"Error en fig_channel_bar: {e}")
 
     @output
     @render_widget
+    @traced
     # Comparamos el gasto medio por categorías (Mnt*) entre los grupos Response
     def fig_cats_bar():
         try:
-            d = df_f()
-            if d.empty:
-                return px.scatter(title="Sin datos para los filtros actuales")
-
-            # Comparamos el gasto medio por categoría (Mnt*) entre Response = 0
-            # y Response = 1
-            cats = [
-                "MntWines",
-                "MntFruits",
-                "MntMeatProducts",
-                "MntFishProducts",
-                "MntSweetProducts",
-                "MntGoldProds",
-            ]
-
-            g = d[["Response"] + cats].groupby("Response").mean().reset_index()
-            g_long = g.melt(
-                id_vars="Response",
-                value_vars=cats,
-                var_name="Categoria",
-                value_name="Gasto_medio",
-            )
-
-            # Renombramos las categorías para facilitar la lectura
-            map_cat = {
-                "MntWines": "Vino",
-                "MntFruits": "Fruta",
-                "MntMeatProducts": "Carne",
-                "MntFishProducts": "Pescado",
-                "MntSweetProducts": "Dulces",
-                "MntGoldProds": "Oro",
-            }
-            g_long["Categoria"] = g_long["Categoria"].map(map_cat)
-            g_long["Response"] = g_long["Response"].map(
-                {0: "No aceptan", 1: "Aceptan"}
-            )
-
-            # Mostramos el gráfico
-            fig = px.bar(
-                g_long,
-                x="Categoria",
-                y="Gasto_medio",
-                color="Response",
-                barmode="group",
-                title="Gasto medio por categoría según Response",
-                color_discrete_map={
-                    "No aceptan": PAL["blue"],
-                    "Aceptan": PAL["mag"],
-                },
-            )
-            return fig
+            rows, w = view()
+            fig = cats_bar_figure(ds, rows, agg_key(w))
+            return mark_preliminary(fig) if preview() else fig
 
         except Exception as e:
             print(f"ERROR fig_cats_bar: {e}", file=sys.stderr)
-            return px.scatter(title=f"Error en fig_cats_bar: {e}")
+            return empty_figure(f"Error en fig_cats_bar: {e}")
 
     @output
     @render_widget
+    @traced
     # Analizamos la asociación entre Recency y TotalSpend por cada grupo de
     # Response
     def fig_recency_spend():
-        d = df_f()
-        if d.empty:
-            return px.scatter(title="Sin datos para los filtros actuales")
+        rows, _ = thin(brushed(base_rows(), ["fig_income"]))
+        fig = recency_spend_figure(ds, rows)
+        if rows.size == 0:
+            return fig
+
+        # En la vista preliminar solo se dibujan los puntos de la muestra, así
+        # que no admitimos selecciones hasta el refinamiento
+        if preview():
+            return mark_preliminary(fig)
+
+        # Cada traza (grupo de Response) conserva el orden de sus filas, así
+        # que los índices de punto seleccionados indexan directamente sus
+        # identificadores de fila
+        codes = df["Response"].to_numpy()[rows]
+        trace_rows = {
+            lbl: rows[codes == code] for code, lbl in enumerate(RESP_LABELS)
+        }
+        parts = {}
+
+        def on_select(trace, points, selector):
+            parts[trace.name] = trace_rows[trace.name][points.point_inds]
+            brushes["fig_recency_spend"].set(
+                np.sort(np.concatenate(list(parts.values())))
+            )
+
+        def on_deselect(trace, points):
+            parts.clear()
+            brushes["fig_recency_spend"].set(None)
+
+        for tr in fig.data:
+            tr.on_selection(on_select)
+            tr.on_deselect(on_deselect)
+        return fig
 
-        d2 = d.copy()
-        d2["Response_lbl"] = d2["Response"].map(
-            {0: "No aceptó", 1: "Aceptó"}
+    @output
+    @render.ui
+    @traced
+    # Resumimos la cohorte seleccionada (todas sus altas, sin el resto de
+    # filtros) a partir del rollup mensual
+    def cohort_text():
+        summ = cohort_summary(cohort, *cohort_sel())
+        if summ["n"] == 0:
+            txt = "Altas en el periodo: 0"
+        else:
+            txt = (
+                f"Altas en el periodo: {summ['n']} "
+                f"(Response = 1: {100.0 * summ['rate']:.2f}%)"
+            )
+        return ui.tags.p(
+            txt,
+            style="margin:-0.5rem 0 0;color:#ffffff;font-size:0.85rem;",
         )
 
-        # Analizamos la asociación Recency – TotalSpend y usamos la escala log
-        # en y para tratar asimetría del gasto
-        fig = px.scatter(
-            d2,
-            x="Recency",
-            y="TotalSpend",
-            color="Response_lbl",
-            opacity=0.6,
-            title="Relación entre antigüedad de compra y gasto total "
-                  "(por respuesta la última campaña)",
-            labels={
-                "Recency": "Días desde la última compra",
-                "TotalSpend": "Gasto total",
-                "Response_lbl": "Respuesta",
-            },
-            color_discrete_map={
-                "No aceptó": PAL["blue"],
-                "Aceptó": PAL["mag"],
-            },
-            log_y=True,
+    @output
+    @render_widget
+    @traced
+    # Representamos la tasa de Response por mes de alta con los filtros
+    # actuales, junto a la referencia de todos los clientes (rollup mensual)
+    def fig_cohort_trend():
+        rows, w = view()
+        fig = cohort_trend_figure(ds, rows, w, cohort_sel(), agg_key(w))
+        return mark_preliminary(fig) if preview() else fig
+
+    @output
+    @render_widget
+    @traced
+    # Comparamos la tasa de Response por patrón de aceptación de las campañas
+    # previas (qué combinaciones de AcceptedCmp1-5 anticipan la respuesta)
+    def fig_cmp_patterns():
+        rows, w = view()
+        fig = cmp_patterns_figure(ds, rows, w, agg_key(w))
+        return mark_preliminary(fig) if preview() else fig
+
+    @reactive.calc
+    # Construimos una sola vez por selección del filtro la máscara de filas
+    # permitidas en la búsqueda de similares (las consultas sucesivas con el
+    # mismo filtro la reutilizan)
+    def sim_allowed():
+        rows = df_f()
+        allowed = np.zeros(len(df), dtype=bool)
+        allowed[rows] = True
+        return allowed, rows
+
+    @reactive.calc
+    # Buscamos en el KD-tree los clientes más parecidos al ID indicado,
+    # opcionalmente solo entre las filas del filtro actual. Devolvemos la
+    # fila del cliente, las filas vecinas y sus distancias (o None)
+    def similar():
+        cid, k = input.sim_id(), input.sim_k()
+        if cid is None or not k or k < 1:
+            return None
+        nb = ds["neighbors"]
+        row = row_of_id(nb, int(cid))
+        if row is None:
+            return None
+
+        allowed = rows = None
+        if input.sim_filtered():
+            allowed, rows = sim_allowed()
+        nn, dist = nearest(nb, row, min(int(k), 100), allowed, rows)
+        return row, nn, dist
+
+    @output
+    @render.ui
+    @traced
+    # Resumimos cuántos de los clientes similares aceptaron la campaña. Un
+    # ID o un número de vecinos vacíos/no válidos (p. ej. mientras se
+    # escribe) tienen su propio aviso: no significan que el ID no exista
+    def sim_summary():
+        cid, k = input.sim_id(), input.sim_k()
+        if cid is None:
+            return ui.tags.p("Indica un ID de cliente.", style="margin:0;")
+        if not k or k < 1:
+            return ui.tags.p("Indica cuántos clientes similares buscar "
+                             "(entre 1 y 100).", style="margin:0;")
+        res = similar()
+        if res is None:
+            return ui.tags.p("No existe ningún cliente con ese ID.",
+                             style="margin:0;")
+        row, nn, _ = res
+        if nn.size == 0:
+            return ui.tags.p("Sin clientes similares con los filtros "
+                             "actuales.", style="margin:0;")
+
+        resp = df["Response"].to_numpy()
+        n1 = int(resp[nn].sum())
+        own = RESP_LABELS[int(resp[row])]
+        txt = (
+            f"Cliente {int(df['ID'].iloc[row])} ({own}) | "
+            f"Clientes similares: {nn.size} | "
+            f"Aceptaron la última campaña: {n1} "
+            f"({100.0 * n1 / nn.size:.1f}%)"
+        )
+        return ui.tags.p(
+            txt,
+            style=(
+                "margin:0;"
+                "padding:0.25rem 0.5rem;"
+                "border-left:4px solid " + PAL["mag"] + ";"
+                "background:rgba(0,0,0,0.03);"
+            ),
         )
-        fig.update_traces(marker_line_color=PAL["edge"])
-        return fig
+
+    @output
+    @render.data_frame
+    @traced
+    # Listamos los clientes similares, del más al menos parecido
+    def sim_table():
+        res = similar()
+        if res is None:
+            return pd.DataFrame()
+        _, nn, dist = res
+        cols = ["ID", "Income", "TotalSpend", "Recency"] + PURCHASE_COLS
+        t = take_cols(df, nn, cols + ["Response"])
+        t.insert(1, "Distancia", np.round(dist, 3))
+        t["Response"] = resp_labels(t["Response"].to_numpy())
+        return t
 
     @reactive.calc
+    @traced
     # Traducimos la selección de la segmentación a la columna del dataset que
     # se usará para el mapeado
     def seg_col():
@@ -665,252 +1737,67 @@ def server(input, output, session):
             "Nivel educativo": "Education",
             "Estado civil": "Marital_Status",
             "Menores en el hogar": "ChildrenHome",
+            "Década de nacimiento": "Year_Birth_decada",
+            "Decil de ingresos": "Income_decil",
+            "Edad al alta (tramos)": "Age_at_enroll_tramo",
+            "Clúster": "Cluster",
         }
 
-        return mapping.get(sel)
+        # Los clústeres solo existen si se ha ejecutado clustering.py
+        s = mapping.get(sel)
+        return s if s in segments else None
 
     @output
     @render_widget
+    @traced
     # Calculamos el mix de canales como cuotas normalizadas y lo comparamos
     # por Response
     def fig_channel_mix():
-        d = df_f()
-
-        if d.empty:
-            return px.scatter(title="Sin datos para los filtros actuales")
-
-        cols = ["NumWebPurchases", "NumCatalogPurchases", "NumStorePurchases"]
-        d2 = d[["Response"] + cols].copy()
-
-        # Calculamos el total por fila para obtener cuotas relativas por canal
-        # y no depender del volumen completo de compras
-        d2["TotCh"] = d2[cols].sum(axis=1)
-        d2 = d2[d2["TotCh"] > 0].copy()
-
-        if d2.empty:
-            return px.scatter(title="Sin compras en los filtros actuales")
-
-        d2["Response_lbl"] = d2["Response"].map({0: "No aceptó", 1: "Aceptó"})
-
-        s = seg_col()
-        if s is not None and s in d.columns:
-            d2[s] = d.loc[d2.index, s].astype(str)
-            group_cols = ["Response_lbl", s]
-        else:
-            group_cols = ["Response_lbl"]
-
-        # Normalizamos la cuota por canal y promediamos las cuotas individuales
-        # por grupo
-        for c in cols:
-            d2[c] = d2[c] / d2["TotCh"]
-
-        g = d2.groupby(group_cols)[cols].mean().reset_index()
-
-        g_long = g.melt(
-            id_vars=group_cols,
-            value_vars=cols,
-            var_name="Canal",
-            value_name="Cuota",
-        )
-
-        map_canal = {
-            "NumWebPurchases": "Web",
-            "NumCatalogPurchases": "Catálogo",
-            "NumStorePurchases": "Tienda",
-        }
-        g_long["Canal"] = g_long["Canal"].map(map_canal)
-
-        title = "Mix de canales (cuota media, normalizada)"
-        if s is not None:
-            title = f"Mix de canales (cuota media) por {s}"
-
-        # Mostramos el gráfico
-        fig = px.bar(
-            g_long,
-            x="Response_lbl",
-            y="Cuota",
-            color="Canal",
-            barmode="stack",
-            facet_col=s if s is not None else None,
-            title=title,
-            labels={"Response_lbl": "Respuesta", "Cuota": "Cuota"},
-        )
-
-        # Establecemos los márgenes para mejorar la legibilidad
-        fig.update_layout(
-            margin=dict(t=75, r=20, b=50, l=60),
-            title=dict(
-                y=0.98,
-                yanchor="top",
-                pad=dict(t=20, b=0),
-            ),
-        )
-
-        fig.update_traces(marker_line_color=PAL["edge"])
-        fig.update_yaxes(tickformat=".0%")
-        return fig
+        rows, w = seg_view()
+        fig = channel_mix_figure(ds, rows, w, seg_col(), agg_key(w))
+        return mark_preliminary(fig) if preview() else fig
 
     @output
     @render_widget
+    @traced
     # Calculamos la composición del gasto como cuotas por categoría y la
     # comparamos por Response
     def fig_spend_mix():
-        d = df_f()
-
-        if d.empty:
-            return px.scatter(title="Sin datos para los filtros actuales")
-
-        cats = [
-            "MntWines",
-            "MntFruits",
-            "MntMeatProducts",
-            "MntFishProducts",
-            "MntSweetProducts",
-            "MntGoldProds",
-        ]
-
-        d2 = d[["Response", "TotalSpend"] + cats].copy()
-        d2 = d2[d2["TotalSpend"] > 0].copy()
-
-        if d2.empty:
-            return px.scatter(title="Sin gasto en los filtros actuales")
-
-        d2["Response_lbl"] = d2["Response"].map({0: "No aceptó", 1: "Aceptó"})
-
-        s = seg_col()
-        if s is not None and s in d.columns:
-            d2[s] = d[s].astype(str)
-            group_cols = ["Response_lbl", s]
-        else:
-            group_cols = ["Response_lbl"]
-
-        # Normalizamos promediamos las cuotas individuales por grupo
-        for c in cats:
-            d2[c] = d2[c] / d2["TotalSpend"]
-
-        g = d2.groupby(group_cols)[cats].mean().reset_index()
-
-        g_long = g.melt(
-            id_vars=group_cols,
-            value_vars=cats,
-            var_name="Categoria",
-            value_name="Cuota",
-        )
-
-        map_cat = {
-            "MntWines": "Vino",
-            "MntFruits": "Fruta",
-            "MntMeatProducts": "Carne",
-            "MntFishProducts": "Pescado",
-            "MntSweetProducts": "Dulces",
-            "MntGoldProds": "Oro",
-        }
-        g_long["Categoria"] = g_long["Categoria"].map(map_cat)
-
-        title = "Composición del gasto (cuota media, normalizada)"
-        if s is not None:
-            title = f"Composición del gasto (cuota media) por {s}"
-
-        # Mostramos el gráfico
-        fig = px.bar(
-            g_long,
-            x="Response_lbl",
-            y="Cuota",
-            color="Categoria",
-            barmode="stack",
-            facet_col=s if s is not None else None,
-            title=title,
-            labels={"Response_lbl": "Respuesta", "Cuota": "Cuota"},
-        )
-
-        fig.update_layout(
-            margin=dict(t=75, r=20, b=50, l=60),
-            title=dict(
-                y=0.98,
-                yanchor="top",
-                pad=dict(t=20, b=0),
-            ),
-        )
-
-        fig.update_traces(marker_line_color=PAL["edge"])
-        fig.update_yaxes(tickformat=".0%")
-        return fig
+        rows, w = seg_view()
+        fig = spend_mix_figure(ds, rows, w, seg_col(), agg_key(w))
+        return mark_preliminary(fig) if preview() else fig
 
     @output
     @render_widget
+    @traced
     # Visualizamos la intensidad media de compra por canal y Response con un
     # mapa de calor
     def fig_channel_heat():
-        d = df_f()
-
-        if d.empty:
-            return px.scatter(title="Sin datos para los filtros actuales")
-
-        cols = ["NumWebPurchases", "NumCatalogPurchases", "NumStorePurchases"]
-        d2 = d[["Response"] + cols].copy()
-        d2["Response_lbl"] = d2["Response"].map({0: "No aceptó", 1: "Aceptó"})
-
-        s = seg_col()
-        if s is not None and s in d.columns:
-            d2[s] = d[s].astype(str)
-            group_cols = ["Response_lbl", s]
-        else:
-            group_cols = ["Response_lbl"]
-
-        # Estimamos la intensidad media por canal y grupo para visualizarla
-        # como mapa de calor
-        g = d2.groupby(group_cols)[cols].mean().reset_index()
-
-        g_long = g.melt(
-            id_vars=group_cols,
-            value_vars=cols,
-            var_name="Canal",
-            value_name="Compras_medias",
-        )
-
-        map_canal = {
-            "NumWebPurchases": "Web",
-            "NumCatalogPurchases": "Catálogo",
-            "NumStorePurchases": "Tienda",
-        }
-        g_long["Canal"] = g_long["Canal"].map(map_canal)
-
-        title = "Intensidad de compra por canal (media)"
-        if s is not None:
-            title = f"Intensidad de compra por canal (media) por {s}"
-
-        # Mostramos el gráfico
-        fig = px.density_heatmap(
-            g_long,
-            x="Canal",
-            y="Response_lbl",
-            z="Compras_medias",
-            facet_col=s if s is not None else None,
-            title=title,
-            labels={"Response_lbl": "Respuesta"},
-        )
-
-        fig.update_layout(
-            margin=dict(t=75, r=20, b=50, l=60),
-            title=dict(y=0.98, yanchor="top", pad=dict(t=20)),
-        )
-        return fig
+        rows, w = seg_view()
+        fig = channel_heat_figure(ds, rows, w, seg_col(), agg_key(w))
+        return mark_preliminary(fig) if preview() else fig
 
     @output
     @render.text
+    @traced
     # Mostramos en la barra lateral un KPI del filtrado (n y tasa Response=1)
     # para orientar la exploración
     def kpi_text():
-        d = df_f()
-        n = len(d)
+        rows = df_f()
+        n = int(rows.size)
 
         # Mostramos un resumen del filtrado en la barra lateral
         if n == 0:
             txt = "Registros = 0\nResponse =1: —"
         else:
-            rate = 100.0 * float(d["Response"].mean())
+            rate = 100.0 * float(df["Response"].to_numpy()[rows].mean())
             txt = f"Registros = {n}\nResponse = 1: {rate:.2f}%"
 
+        if any(brushes[src]() is not None for src in BRUSH_SOURCES):
+            txt += "\nSelección gráfica activa"
+        if preview():
+            txt += "\nVista preliminar (muestra)"
+
         return ui.tags.pre(
             txt,
             style=(
@@ -929,31 +1816,60 @@ def server(input, output, session):
     @reactive.event(input.reset)
     # Restablecemos los filtros globales a su configuración inicial
     def _reset_filters():
-        ui.update_slider("recency", value=(0, 99))
+        b = ds["bounds"]
+        ui.update_slider("recency", value=(0, b["recency_max"]))
         ui.update_slider(
             "income",
-            value=(0, int(thr["inc_p995"])),
+            value=(0, b["income_max"]),
         )
         ui.update_select("response", selected="Todas")
+        ui.update_slider(
+            "cohort",
+            value=(b["cohort_min"], b["cohort_max"]),
+            time_format="%m/%Y",
+        )
+        for src in BRUSH_SOURCES:
+            brushes[src].set(None)
+
+    # Tomamos el formato de exportación (solo CSV si pyarrow no está
+    # instalado)
+    def export_fmt() -> str:
+        return input.export_fmt() if HAS_PARQUET else "csv"
+
+    @render.download_button(
+        filename=lambda: f"clientes_{ds['name']}.{export_fmt()}",
+        media_type=lambda: EXPORT_FORMATS[export_fmt()],
+    )
+    # Enviamos las filas del filtro actual por bloques, cediendo el control
+    # entre bloques para no bloquear al resto de sesiones
+    async def export_rows():
+        rows = df_f()
+        cols = list(input.export_cols()) or list(df.columns)
+        for chunk in iter_export(df, rows, cols, export_fmt()):
+            yield chunk
+            await asyncio.sleep(0)
 
     @output
     @render.ui
+    @traced
     # Generamos el resumen final con los filtros activos
     def concl_kpis():
-        d = df_f()
+        rows = df_f()
 
         # Calculamos de nuevo un resumen final con los filtros activos
-        if d.empty:
+        if rows.size == 0:
             return ui.tags.p("Sin datos con los filtros actuales.",
                              style="margin:0;")
 
-        n = int(len(d))
-        rate = 100.0 * float(d["Response"].mean())
+        n = int(rows.size)
+        resp = df["Response"].to_numpy()[rows]
+        rate = 100.0 * float(resp.mean())
 
-        d0 = d.loc[d["Response"] == 0, "TotalSpend"].dropna()
-        d1 = d.loc[d["Response"] == 1, "TotalSpend"].dropna()
+        spend = df["TotalSpend"].to_numpy()[rows]
+        d0 = spend[resp == 0]
+        d1 = spend[resp == 1]
 
-        if d0.empty or d1.empty:
+        if d0.size == 0 or d1.size == 0:
             txt = (
                 f"Registros: {n} | "
                 f"Tasa Response=1: {rate:.2f}% | "
@@ -961,16 +1877,22 @@ def server(input, output, session):
             )
             return ui.tags.p(txt, style="margin:0;")
 
-        med0 = float(d0.median())
-        med1 = float(d1.median())
+        med0 = float(np.median(d0))
+        med1 = float(np.median(d1))
         delta = med1 - med0
 
+        ci = kpi_ci()
+        r_lo, r_hi = (100.0 * x for x in ci["rate_ci"])
+        d_lo, d_hi = ci["diff_ci"]
+
         txt = (
             f"Registros: {n} | "
-            f"Tasa Response=1: {rate:.2f}% | "
+            f"Tasa Response=1: {rate:.2f}% "
+            f"(IC 95%: {r_lo:.2f}–{r_hi:.2f}%) | "
             f"Mediana TotalSpend (No aceptó): {med0:,.0f} | "
             f"Mediana TotalSpend (Aceptó): {med1:,.0f} | "
-            f"Diferencia: {delta:,.0f}"
+            f"Diferencia: {delta:,.0f} "
+            f"(IC 95%: {d_lo:,.0f} a {d_hi:,.0f})"
         )
 
         return ui.tags.p(
@@ -984,5 +1906,11 @@ def server(input, output, session):
         )
 
 
-# Construimos la app e indicamos la carpeta de estáticos para mostrar el logo
-app = App(app_ui, server, static_assets=str(WWW))
+# Construimos la app e indicamos la carpeta de estáticos para mostrar el
+# logo; la servimos junto al endpoint de salud (progreso del precálculo)
+app = Starlette(routes=[
+    Route("/health", warmup_health),
+    Mount("/", app=preload_dataset(
+        App(app_ui, server, static_assets=str(WWW))
+    )),
+])
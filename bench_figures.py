@@ -0,0 +1,167 @@
+# Benchmark de construcción de figuras: comparamos plotly express (px.* y
+# estilos en cada render) con la fábrica de esqueletos de figures.py sobre
+# varios estados de filtro y segmentaciones. Comprobamos además que ambas
+# rutas producen la misma figura.
+#
+# Uso:
+#   python bench_figures.py [--repeat 20] > bench_output.txt
+import argparse
+import time
+import numpy as np
+import plotly.express as px
+from data_prep import (
+    load_data,
+    filter_rows,
+    take_cols,
+    resp_labels,
+    build_segments,
+    fold_top_k,
+    group_means,
+    PURCHASE_COLS,
+)
+from figures import table_figure, grouped_figure, _skeletons
+
+PAL = {"blue": "#224E7F", "edge": "#385E88", "mag": "#9A187D"}
+
+# Estados de filtro representativos (recency, income, spend, response)
+STATES = [
+    ((0, 99), (0, 200000), (0, 3000), None),
+    ((10, 60), (20000, 80000), (0, 3000), None),
+    ((0, 30), (0, 50000), (100, 1500), 1),
+    ((40, 99), (30000, 120000), (0, 800), 0),
+]
+SEGMENTS = [None, "Education", "Marital_Status", "ChildrenHome",
+            "Year_Birth_decada", "Income_decil", "Age_at_enroll_tramo"]
+
+
+def style_mix(fig):
+    fig.update_layout(
+        margin=dict(t=75, r=20, b=50, l=60),
+        title=dict(y=0.98, yanchor="top", pad=dict(t=20, b=0)),
+    )
+    fig.update_traces(marker_line_color=PAL["edge"])
+    fig.update_yaxes(tickformat=".0%")
+
+
+def style_scatter(fig):
+    fig.update_traces(marker_line_color=PAL["edge"])
+
+
+# Construimos la tabla de cuotas por Response (y segmento) como en la app
+def mix_table(df, rows, seg, segs):
+    cols = PURCHASE_COLS
+    extra = [seg] if seg else []
+    tot = df["TotalPurchases"].to_numpy()[rows]
+    rows, tot = rows[tot > 0], tot[tot > 0]
+    if seg:
+        codes, labels = fold_top_k(segs[seg][0][rows], segs[seg][1])
+    else:
+        codes, labels = np.zeros(rows.size, dtype=np.int32), [None]
+    g = group_means(
+        df["Response"].to_numpy()[rows], codes, labels,
+        {c: df[c].to_numpy()[rows] / tot for c in cols}, seg,
+    )
+    g["Response_lbl"] = resp_labels(g["Response"].to_numpy())
+    return g.melt(
+        id_vars=["Response_lbl"] + extra,
+        value_vars=cols,
+        var_name="Canal",
+        value_name="Cuota",
+    )
+
+
+def cases(df, rows, seg, segs):
+    g = mix_table(df, rows, seg, segs)
+    title = f"Mix de canales por {seg}"
+    mix_kw = dict(
+        x="Response_lbl", y="Cuota", color="Canal", barmode="stack",
+        facet_col=seg, title=title,
+    )
+
+    d2 = take_cols(df, rows, ["Response", "Recency", "TotalSpend"])
+    d2["Response_lbl"] = resp_labels(d2["Response"].to_numpy())
+    sc_kw = dict(
+        x="Recency", y="TotalSpend", color="Response_lbl", opacity=0.6,
+        title="Recency vs TotalSpend", log_y=True,
+        color_discrete_map={"No aceptó": PAL["blue"], "Aceptó": PAL["mag"]},
+    )
+
+    def px_mix():
+        fig = px.bar(g, **mix_kw)
+        style_mix(fig)
+        return fig
+
+    def px_scatter():
+        fig = px.scatter(d2, **sc_kw)
+        style_scatter(fig)
+        return fig
+
+    return {
+        "bar (mix)": (
+            px_mix,
+            lambda: table_figure("mix", g, {"y": "Cuota"}, px.bar,
+                                 style=style_mix, **mix_kw),
+        ),
+        "scatter": (
+            px_scatter,
+            lambda: grouped_figure(
+                "scatter", d2, {"x": "Recency", "y": "TotalSpend"},
+                px.scatter, group="Response_lbl", style=style_scatter,
+                **sc_kw,
+            ),
+        ),
+    }
+
+
+def _same(a, b) -> bool:
+    ja, jb = a.to_plotly_json(), b.to_plotly_json()
+    if ja["layout"] != jb["layout"] or len(ja["data"]) != len(jb["data"]):
+        return False
+    for ta, tb in zip(ja["data"], jb["data"]):
+        if ta.keys() != tb.keys():
+            return False
+        for k in ta:
+            va, vb = ta[k], tb[k]
+            if isinstance(va, np.ndarray) or isinstance(vb, np.ndarray):
+                if not np.array_equal(np.asarray(va), np.asarray(vb)):
+                    return False
+            elif va != vb:
+                return False
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compara plotly express con los esqueletos de figures.py",
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    df = load_data(features=True)
+    segs = build_segments(df)
+    _skeletons.clear()
+
+    timings = {}
+    mismatches = 0
+    for seg in SEGMENTS:
+        for rec, inc, spend, resp in STATES:
+            rows = filter_rows(df, rec, inc, spend, resp)
+            for name, (f_px, f_fac) in cases(df, rows, seg, segs).items():
+                mismatches += not _same(f_px(), f_fac())
+                for path, f in (("px", f_px), ("fábrica", f_fac)):
+                    t0 = time.perf_counter()
+                    for _ in range(args.repeat):
+                        f()
+                    dt = (time.perf_counter() - t0) / args.repeat
+                    timings.setdefault((name, path), []).append(dt)
+
+    print(f"{'figura':<12} {'ruta':<8} {'media ms':>9} {'p95 ms':>9}")
+    for (name, path), ts in sorted(timings.items()):
+        ts = np.asarray(ts) * 1000.0
+        print(f"{name:<12} {path:<8} {ts.mean():>9.2f} "
+              f"{np.percentile(ts, 95):>9.2f}")
+    print(f"Figuras distintas entre rutas: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
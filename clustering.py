@@ -0,0 +1,161 @@
+# Segmentación por clústeres (proceso fuera de línea): ejecutamos k-means por
+# mini-lotes sobre las variables estandarizadas de cada cliente y guardamos
+# las asignaciones y los centroides en la caché del dataset, con la huella de
+# la versión de los datos y k. La App solo lee las etiquetas guardadas, así
+# que el coste del agrupamiento nunca se paga por petición.
+#
+# Uso:
+#   python clustering.py                       # todos los datasets, k=5
+#   python clustering.py --dataset marca_a --k 4 6
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+# Número de clústeres que muestra la App (debe haberse calculado antes)
+CLUSTER_K = int(os.environ.get("APP_CLUSTER_K", "5"))
+
+# Parámetros de k-means por mini-lotes: tamaño del lote, iteraciones máximas,
+# tolerancia de parada (desplazamiento de los centroides) y tamaño de los
+# bloques de filas al asignar (acota la matriz de distancias en memoria)
+BATCH_SIZE = 1024
+MAX_ITER = 300
+TOL = 1e-4
+CHUNK_ROWS = 65536
+INIT_SAMPLE = 10000
+
+
+# Asignamos cada fila a su centroide más cercano, por bloques de filas
+def assign(X: np.ndarray, C: np.ndarray, chunk: int = CHUNK_ROWS) -> tuple:
+    labels = np.empty(X.shape[0], dtype=np.int32)
+    inertia = 0.0
+    c2 = (C ** 2).sum(axis=1)
+    for s in range(0, X.shape[0], chunk):
+        x = X[s:s + chunk]
+        d2 = (x ** 2).sum(axis=1)[:, None] - 2.0 * x @ C.T + c2
+        lab = d2.argmin(axis=1)
+        labels[s:s + chunk] = lab
+        inertia += float(np.maximum(d2[np.arange(x.shape[0]), lab], 0).sum())
+    return labels, inertia
+
+
+# Elegimos los centroides iniciales con k-means++ sobre una muestra
+def _init_centroids(X: np.ndarray, k: int, rng) -> np.ndarray:
+    n = X.shape[0]
+    sample = X[rng.choice(n, min(n, INIT_SAMPLE), replace=False)]
+    C = [sample[rng.integers(sample.shape[0])]]
+    d2 = ((sample - C[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        p = d2 / d2.sum() if d2.sum() > 0 else None
+        C.append(sample[rng.choice(sample.shape[0], p=p)])
+        d2 = np.minimum(d2, ((sample - C[-1]) ** 2).sum(axis=1))
+    return np.asarray(C, dtype=float)
+
+
+# Ejecutamos k-means por mini-lotes: en cada iteración asignamos un lote y
+# movemos cada centroide hacia la media de sus puntos con un paso 1/n
+# (n = puntos acumulados por el centroide). Numeramos los clústeres de mayor
+# a menor tamaño para que las etiquetas sean estables
+def minibatch_kmeans(
+    X: np.ndarray,
+    k: int,
+    batch_size: int = BATCH_SIZE,
+    max_iter: int = MAX_ITER,
+    tol: float = TOL,
+    seed: int = 0,
+) -> tuple:
+    rng = np.random.default_rng(seed)
+    n, d = X.shape
+    k = min(k, n)
+    C = _init_centroids(X, k, rng)
+    counts = np.zeros(k)
+
+    for _ in range(max_iter):
+        b = X[rng.integers(0, n, min(batch_size, n))]
+        lab, _ = assign(b, C)
+        nb = np.bincount(lab, minlength=k).astype(float)
+        sums = np.stack(
+            [np.bincount(lab, weights=b[:, j], minlength=k) for j in range(d)],
+            axis=1,
+        )
+        counts += nb
+        upd = nb > 0
+        step = (sums[upd] - nb[upd, None] * C[upd]) / counts[upd, None]
+        C[upd] += step
+        if np.sqrt((step ** 2).sum(axis=1)).max(initial=0.0) < tol:
+            break
+
+    labels, inertia = assign(X, C)
+    order = np.argsort(-np.bincount(labels, minlength=k), kind="stable")
+    rank = np.empty(k, dtype=np.int32)
+    rank[order] = np.arange(k, dtype=np.int32)
+    return rank[labels], C[order], inertia
+
+
+def cluster_path(cache_dir: Path, k: int) -> Path:
+    return cache_dir / f"clusters_k{k}.npz"
+
+
+# Guardamos etiquetas, centroides y la huella del dataset
+def save_clusters(cache_dir: Path, key: str, k: int, labels: np.ndarray,
+                  centroids: np.ndarray, meta: dict) -> None:
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    np.savez(
+        cluster_path(cache_dir, k),
+        labels=labels,
+        centroids=centroids,
+        key=np.array(key),
+        meta=np.array(json.dumps(meta)),
+    )
+
+
+# Leemos las etiquetas guardadas para (versión del dataset, k); devolvemos
+# None si no existen o corresponden a otra versión de los datos
+def load_clusters(cache_dir: Path, key: str, k: int) -> tuple | None:
+    try:
+        with np.load(cluster_path(cache_dir, k)) as z:
+            if str(z["key"]) != key:
+                return None
+            return z["labels"], z["centroids"]
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def main(argv: list | None = None) -> None:
+    from datasets import DATASETS, CACHE_DIR, read_dataset
+    from neighbors import feature_matrix, NEIGHBOR_COLS
+    from data_prep import SPEND_COLS
+
+    parser = argparse.ArgumentParser(
+        description="Calcula los clústeres de clientes de cada dataset",
+    )
+    parser.add_argument("--dataset", nargs="+", default=list(DATASETS))
+    parser.add_argument("--k", type=int, nargs="+", default=[CLUSTER_K])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    for name in args.dataset:
+        if name not in DATASETS:
+            print(f"Dataset desconocido: {name}", file=sys.stderr)
+            continue
+        df, key = read_dataset(name)
+        X = feature_matrix(df)
+        for k in args.k:
+            t0 = time.perf_counter()
+            labels, C, inertia = minibatch_kmeans(X, k, seed=args.seed)
+            meta = {
+                "features": NEIGHBOR_COLS + [f"{c}_share" for c in SPEND_COLS],
+                "inertia": inertia,
+                "seed": args.seed,
+            }
+            save_clusters(CACHE_DIR / name, key, k, labels, C, meta)
+            sizes = np.bincount(labels, minlength=k).tolist()
+            print(f"{name} k={k}: tamaños {sizes}, inercia {inertia:,.0f} "
+                  f"({time.perf_counter() - t0:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,12 @@
 # Importamos las librerías necesarias
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import glob
+import hashlib
+import importlib.util
+import json
+import os
+import numpy as np
 import pandas as pd
 
 # Definimos la ruta base del módulo para construir rutas relativas
@@ -13,13 +20,54 @@ PURCHASE_COLS = ["NumWebPurchases", "NumCatalogPurchases", "NumStorePurchases"]
 CMP_COLS = ["AcceptedCmp1", "AcceptedCmp2", "AcceptedCmp3", "AcceptedCmp4",
             "AcceptedCmp5"]
 
+# Etiquetas de Response indexadas por su código (0/1) para construir
+# categóricos sin mapear columnas de texto fila a fila
+RESP_LABELS = ["No aceptó", "Aceptó"]
 
-# Cargamos los datos desde el CSV (separado por tabulador) y tipificamos la
-# fecha de alta
-def load_data(path: str = "marketing_campaign.csv") -> pd.DataFrame:
-    # Construimos la ruta del fichero respecto al directorio del proyecto
-    csv_path = HERE / path
-    df = pd.read_csv(csv_path, sep="\t")
+
+# Usamos el lector CSV multihilo de pyarrow si está instalado; si no,
+# recurrimos al motor C de pandas
+CSV_ENGINE = "pyarrow" if importlib.util.find_spec("pyarrow") else "c"
+
+# Extensiones que se consideran shards al indicar un directorio
+SHARD_PATTERNS = ("*.csv", "*.tsv")
+
+# Versión del formato de la caché de columnas (forma parte de su huella)
+CACHE_FORMAT = "2"
+
+# Número de patrones de aceptación de las campañas previas (2^5) y orden de
+# presentación: por número de campañas aceptadas y, dentro, por código
+N_PATTERNS = 2 ** len(CMP_COLS)
+PATTERN_ORDER = sorted(range(N_PATTERNS), key=lambda p: (bin(p).count("1"), p))
+
+# Número máximo de segmentos que se muestran y cuota mínima de filas para
+# mostrar uno por separado; el resto se agrupa en "Otros"
+SEG_TOP_K = 10
+SEG_MIN_SHARE = 0.01
+SEG_OTHER = "Otros"
+SEG_MISSING = "Sin dato"
+
+# Muestras estratificadas para la vista preliminar: tamaño objetivo y mínimo
+# de filas por estrato (Response × segmento)
+SAMPLE_ROWS = 20000
+SAMPLE_MIN_PER_STRATUM = 200
+
+
+# Resolvemos la ruta indicada (fichero, directorio o patrón glob) en la
+# lista ordenada de ficheros a leer, respecto al directorio del proyecto
+def resolve_paths(path: str) -> list:
+    full = HERE / path
+    if any(ch in str(path) for ch in "*?["):
+        return sorted(Path(p) for p in glob.glob(str(full)))
+    if full.is_dir():
+        return sorted(p for pat in SHARD_PATTERNS for p in full.glob(pat))
+    return [full]
+
+
+# Leemos un fichero (separado por tabulador), tipificamos la fecha de alta
+# y, si se pide, construimos las variables derivadas del propio shard
+def _read_shard(csv_path: Path, features: bool) -> pd.DataFrame:
+    df = pd.read_csv(csv_path, sep="\t", engine=CSV_ENGINE)
 
     # Convertimos la columna de fecha de alta a tipo datetime
     df["Dt_Customer"] = pd.to_datetime(
@@ -28,9 +76,75 @@ def load_data(path: str = "marketing_campaign.csv") -> pd.DataFrame:
         errors="coerce",
     )
 
+    return make_features(df) if features else df
+
+
+# Cargamos los datos desde el CSV (separado por tabulador) y tipificamos la
+# fecha de alta. Admitimos también un directorio o un patrón glob con varios
+# shards: se leen en paralelo, se concatenan y se eliminan los ID repetidos
+# (prevalece el shard posterior en orden de nombre)
+def load_data(
+    path: str = "marketing_campaign.csv",
+    features: bool = False,
+) -> pd.DataFrame:
+    paths = resolve_paths(path)
+    if not paths:
+        raise FileNotFoundError(f"No se encontraron ficheros en {path!r}")
+
+    if len(paths) == 1:
+        return _read_shard(paths[0], features)
+
+    workers = min(len(paths), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        frames = list(pool.map(lambda p: _read_shard(p, features), paths))
+
+    df = pd.concat(frames, ignore_index=True)
+    del frames
+
+    # Solo reconstruimos el DataFrame si realmente hay duplicados
+    dup = df["ID"].duplicated(keep="last").to_numpy()
+    if dup.any():
+        df = df.loc[~dup].reset_index(drop=True)
+
     return df
 
 
+# Calculamos la huella de los ficheros de origen (ruta, tamaño y fecha de
+# modificación) para invalidar la caché de columnas cuando cambian
+def source_key(path: str) -> str:
+    parts = [CACHE_FORMAT]
+    for p in resolve_paths(path):
+        st = p.stat()
+        parts.append(f"{p}:{st.st_size}:{st.st_mtime_ns}")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+# Guardamos cada columna del DataFrame (ya con las variables derivadas) como
+# un .npy, junto con los nombres y la huella del origen
+def save_column_cache(df: pd.DataFrame, cache_dir: Path, key: str) -> None:
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    for i, c in enumerate(df.columns):
+        np.save(cache_dir / f"{i}.npy", df[c].to_numpy(), allow_pickle=True)
+    meta = {"key": key, "columns": [str(c) for c in df.columns]}
+    (cache_dir / "meta.json").write_text(json.dumps(meta))
+
+
+# Recuperamos el DataFrame desde la caché de columnas; devolvemos None si no
+# existe o si corresponde a otra versión de los ficheros de origen
+def load_column_cache(cache_dir: Path, key: str) -> pd.DataFrame | None:
+    try:
+        meta = json.loads((cache_dir / "meta.json").read_text())
+        if meta["key"] != key:
+            return None
+        cols = {
+            c: np.load(cache_dir / f"{i}.npy", allow_pickle=True)
+            for i, c in enumerate(meta["columns"])
+        }
+    except (OSError, ValueError, KeyError):
+        return None
+    return pd.DataFrame(cols, copy=False)
+
+
 def make_features(df: pd.DataFrame) -> pd.DataFrame:
     # Trabajamos sobre una copia para no modificar el DataFrame original
     df = df.copy()
@@ -50,6 +164,10 @@ def make_features(df: pd.DataFrame) -> pd.DataFrame:
     # Estimamos la edad al alta a partir del año de alta y el año de nacimiento
     df["Age_at_enroll"] = df["Dt_Customer"].dt.year - df["Year_Birth"]
 
+    # Empaquetamos las aceptaciones de campañas previas (bits 0-4) y Response
+    # (bit 5) en un único código por cliente (0-63)
+    df["Accept_Code"] = pack_acceptance(df)
+
     return df
 
 
@@ -59,3 +177,424 @@ def robust_thresholds(df: pd.DataFrame) -> dict:
     inc_p995 = df["Income"].dropna().quantile(0.995)
     age_p995 = df["Age_at_enroll"].quantile(0.995)
     return {"inc_p995": float(inc_p995), "age_p995": float(age_p995)}
+
+
+# Calculamos la selección de filas que cumple los filtros globales. Devolvemos
+# posiciones (no un DataFrame) para que cada vista extraiga solo las columnas
+# que necesita de las columnas compartidas, sin copias intermedias. Si se
+# indica una preselección de filas (p. ej. una cohorte), solo se evalúan esas
+def filter_rows(
+    df: pd.DataFrame,
+    recency: tuple,
+    income: tuple,
+    spend: tuple,
+    response: int | None = None,
+    rows: np.ndarray | None = None,
+) -> np.ndarray:
+    rec = df["Recency"].to_numpy()
+    inc = df["Income"].to_numpy()
+    tot = df["TotalSpend"].to_numpy()
+    resp = df["Response"].to_numpy()
+    if rows is not None:
+        rec, inc, tot, resp = rec[rows], inc[rows], tot[rows], resp[rows]
+
+    # Reutilizamos dos máscaras booleanas y operamos en sitio para que el
+    # coste extra por cambio de filtro sea de ~2 bytes por fila más el índice
+    m = np.greater_equal(rec, recency[0])
+    tmp = np.less_equal(rec, recency[1])
+    m &= tmp
+
+    # Los Income faltantes se conservan: las comparaciones con NaN son falsas,
+    # así que negamos las condiciones de exclusión
+    np.less(inc, income[0], out=tmp)
+    np.logical_not(tmp, out=tmp)
+    m &= tmp
+    np.greater(inc, income[1], out=tmp)
+    np.logical_not(tmp, out=tmp)
+    m &= tmp
+
+    np.greater_equal(tot, spend[0], out=tmp)
+    m &= tmp
+    np.less_equal(tot, spend[1], out=tmp)
+    m &= tmp
+
+    if response is not None:
+        np.equal(resp, response, out=tmp)
+        m &= tmp
+
+    return np.flatnonzero(m) if rows is None else rows[m]
+
+
+# Extraemos únicamente las columnas indicadas para las filas seleccionadas
+def take_cols(df: pd.DataFrame, rows: np.ndarray, cols: list) -> pd.DataFrame:
+    return pd.DataFrame(
+        {c: df[c].to_numpy()[rows] for c in cols},
+        copy=False,
+    )
+
+
+# Construimos las etiquetas de Response a partir de sus códigos (categórico)
+def resp_labels(
+    codes: np.ndarray,
+    labels: list = RESP_LABELS,
+) -> pd.Categorical:
+    return pd.Categorical.from_codes(codes, categories=labels)
+
+
+# Precomputamos, para cada columna indicada, el orden de las filas por valor
+# (sin faltantes). Permite traducir una selección por rango (p. ej. barras de
+# un histograma) en identificadores de fila con búsquedas binarias
+def build_row_index(df: pd.DataFrame, cols: tuple = ("Income",)) -> dict:
+    index = {}
+    for c in cols:
+        values = df[c].to_numpy()
+        order = np.argsort(values, kind="stable")
+        order = order[~np.isnan(values[order])]
+        index[c] = (order, values[order])
+    return index
+
+
+# Devolvemos (ordenadas) las filas con valor en [lo, hi), o [lo, hi] si se
+# cierra por la derecha; el coste es proporcional al tamaño de la selección
+def rows_in_range(
+    index: dict,
+    col: str,
+    lo: float,
+    hi: float,
+    closed_right: bool = False,
+) -> np.ndarray:
+    order, values = index[col]
+    a = np.searchsorted(values, lo, side="left")
+    b = np.searchsorted(values, hi, side="right" if closed_right else "left")
+    return np.sort(order[a:b])
+
+
+# Traducimos los valores x de una selección sobre un histograma (llega uno
+# por fila de cada barra, repetido) a las filas de las barras seleccionadas:
+# deduplicamos antes las barras y hacemos una búsqueda por barra, así que el
+# coste es proporcional al tamaño de la selección
+def rows_in_bins(
+    index: dict,
+    col: str,
+    xs,
+    lo: float,
+    size: float,
+    nbins: int,
+) -> np.ndarray:
+    xs = np.asarray(xs, dtype=float)
+    xs = xs[~np.isnan(xs)]
+    if xs.size == 0:
+        return np.empty(0, np.int64)
+    bins = np.unique(
+        np.clip(((xs - lo) // size).astype(np.int64), 0, nbins - 1)
+    )
+    parts = [
+        rows_in_range(
+            index,
+            col,
+            lo + b * size,
+            lo + (b + 1) * size,
+            closed_right=b == nbins - 1,
+        )
+        for b in bins
+    ]
+    return np.sort(np.concatenate(parts))
+
+
+# Intersectamos una selección ordenada de filas con un conjunto ordenado de
+# identificadores, buscando cada identificador en la selección
+def intersect_rows(rows: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    if rows.size == 0 or ids.size == 0:
+        return ids[:0]
+    pos = np.searchsorted(rows, ids)
+    np.minimum(pos, rows.size - 1, out=pos)
+    return ids[rows[pos] == ids]
+
+
+# Identificamos un estado de filtro por la huella de sus filas (para las
+# cachés compartidas entre sesiones)
+def rows_digest(rows: np.ndarray) -> bytes:
+    return hashlib.blake2b(rows.tobytes(), digest_size=16).digest()
+
+
+# Ordenamos los clientes por fecha de alta y guardamos el desplazamiento de
+# inicio de cada mes, el código de mes de cada fila y un rollup mensual de
+# recuentos y gasto por Response (acumulado para sumar rangos en O(1))
+def build_cohort_index(df: pd.DataFrame) -> dict:
+    month = df["Dt_Customer"].to_numpy().astype("datetime64[M]")
+    order = np.argsort(month, kind="stable")
+    order = order[~np.isnat(month[order])]
+
+    months, starts = np.unique(month[order], return_index=True)
+    offsets = np.append(starts, order.size)
+
+    # Asignamos a cada fila su mes como código entero (-1 si no hay fecha)
+    code = np.full(len(df), -1, dtype=np.int64)
+    code[order] = np.repeat(np.arange(months.size), np.diff(offsets))
+
+    resp = df["Response"].to_numpy()[order]
+    spend = df["TotalSpend"].to_numpy()[order]
+    codes = code[order]
+
+    rollup = pd.DataFrame({"month": months})
+    for r in (0, 1):
+        sel = resp == r
+        rollup[f"n_{r}"] = np.bincount(codes[sel], minlength=months.size)
+        rollup[f"spend_{r}"] = np.bincount(
+            codes[sel], weights=spend[sel], minlength=months.size
+        )
+
+    # Añadimos una fila inicial de ceros para restar acumulados sin casos
+    # especiales en el primer mes
+    cum = np.vstack([
+        np.zeros(4),
+        rollup[["n_0", "n_1", "spend_0", "spend_1"]].cumsum().to_numpy(),
+    ])
+
+    return {
+        "order": order,
+        "months": months,
+        "offsets": offsets,
+        "code": code,
+        "rollup": rollup,
+        "cum": cum,
+    }
+
+
+# Traducimos un rango de fechas a un intervalo semiabierto [i0, i1) de meses
+# mediante búsquedas binarias sobre los meses ordenados
+def cohort_span(index: dict, start, end) -> tuple:
+    months = index["months"]
+    i0 = np.searchsorted(months, np.datetime64(start, "M"), side="left")
+    i1 = np.searchsorted(months, np.datetime64(end, "M"), side="right")
+    return int(i0), int(i1)
+
+
+# Devolvemos (ordenadas) las filas dadas de alta en los meses [i0, i1)
+def cohort_rows(index: dict, i0: int, i1: int) -> np.ndarray:
+    offsets = index["offsets"]
+    return np.sort(index["order"][offsets[i0]:offsets[i1]])
+
+
+# Resumimos la cohorte [i0, i1) con el rollup acumulado, sin tocar las filas
+def cohort_summary(index: dict, i0: int, i1: int) -> dict:
+    n0, n1, s0, s1 = index["cum"][i1] - index["cum"][i0]
+    n = n0 + n1
+    return {
+        "n": int(n),
+        "rate": float(n1 / n) if n else float("nan"),
+        "spend_0": float(s0),
+        "spend_1": float(s1),
+    }
+
+
+# Codificamos una columna categórica como enteros 0..k-1 (orden alfabético de
+# sus valores); los valores ausentes reciben un código propio al final
+def _category_codes(values: pd.Series) -> tuple:
+    codes, uniques = pd.factorize(values, sort=True)
+    labels = [str(u) for u in uniques]
+    if (codes < 0).any():
+        codes = np.where(codes < 0, len(labels), codes)
+        labels.append(SEG_MISSING)
+    return codes.astype(np.int32), labels
+
+
+# Codificamos una columna numérica por intervalos [edges[i], edges[i+1]);
+# los valores ausentes reciben un código propio al final
+def _binned_codes(
+    values: np.ndarray,
+    edges: np.ndarray,
+    labels: list,
+) -> tuple:
+    codes = np.searchsorted(edges[1:-1], values, side="right")
+    codes = codes.astype(np.int32)
+    miss = np.isnan(values)
+    labels = list(labels)
+    if miss.any():
+        codes[miss] = len(labels)
+        labels.append(SEG_MISSING)
+    return codes, labels
+
+
+# Precalculamos una sola vez los códigos enteros de cada segmentación para
+# agrupar con bincount en lugar de convertir columnas a texto en cada render.
+# Devolvemos {nombre: (códigos por fila, etiquetas por código)}
+def build_segments(df: pd.DataFrame) -> dict:
+    segs = {
+        c: _category_codes(df[c])
+        for c in ("Education", "Marital_Status", "ChildrenHome")
+    }
+
+    # Década de nacimiento (solo las décadas presentes)
+    dec = (df["Year_Birth"].to_numpy() // 10) * 10
+    uniq, codes = np.unique(dec, return_inverse=True)
+    segs["Year_Birth_decada"] = (
+        codes.astype(np.int32),
+        [f"{d}s" for d in uniq],
+    )
+
+    # Deciles de Income con su rango en miles
+    inc = df["Income"].to_numpy(dtype=float)
+    edges = np.nanquantile(inc, np.linspace(0.0, 1.0, 11))
+    labels = [
+        f"D{i + 1} ({edges[i] / 1000:.0f}k-{edges[i + 1] / 1000:.0f}k)"
+        for i in range(10)
+    ]
+    segs["Income_decil"] = _binned_codes(inc, edges, labels)
+
+    # Tramos de 10 años de edad al alta
+    age = df["Age_at_enroll"].to_numpy(dtype=float)
+    lo = np.nanmin(age) // 10 * 10
+    hi = np.nanmax(age) // 10 * 10 + 10
+    edges = np.arange(lo, hi + 10, 10)
+    labels = [f"{a:.0f}-{a + 9:.0f}" for a in edges[:-1]]
+    segs["Age_at_enroll_tramo"] = _binned_codes(age, edges, labels)
+
+    return segs
+
+
+# Conservamos (en su orden original) los k segmentos con más filas que
+# superan la cuota mínima y agrupamos el resto en "Otros"; si solo quedaría
+# un segmento en "Otros" lo mostramos tal cual. Los segmentos sin filas
+# desaparecen
+def fold_top_k(
+    codes: np.ndarray,
+    labels: list,
+    k: int = SEG_TOP_K,
+    min_share: float = SEG_MIN_SHARE,
+    weights: np.ndarray | None = None,
+) -> tuple:
+    counts = np.bincount(codes, weights=weights, minlength=len(labels))
+    present = np.flatnonzero(counts)
+    top = np.argsort(-counts, kind="stable")[:k]
+    kept = np.sort(top[counts[top] >= min_share * counts.sum()])
+    if present.size - kept.size <= 1:
+        kept = present
+
+    lut = np.full(len(labels), kept.size, dtype=np.int32)
+    lut[kept] = np.arange(kept.size, dtype=np.int32)
+    new_labels = [labels[i] for i in kept]
+    if kept.size < present.size:
+        new_labels.append(SEG_OTHER)
+    return lut[codes], new_labels
+
+
+# Calculamos la media de cada columna por (Response, segmento) con bincount
+# sobre una clave entera combinada. Devolvemos solo las combinaciones con
+# filas, ordenadas por Response y código de segmento. Con `weights` (filas de
+# una muestra) calculamos medias ponderadas
+def group_means(
+    resp: np.ndarray,
+    codes: np.ndarray,
+    labels: list,
+    values: dict,
+    seg_name: str | None = None,
+    weights: np.ndarray | None = None,
+) -> pd.DataFrame:
+    n_seg = len(labels)
+    key = resp.astype(np.intp) * n_seg + codes
+    counts = np.bincount(key, weights=weights, minlength=2 * n_seg)
+    nz = np.flatnonzero(counts)
+
+    out = {"Response": nz // n_seg}
+    if seg_name is not None:
+        out[seg_name] = np.asarray(labels, dtype=object)[nz % n_seg]
+    for c, v in values.items():
+        if weights is not None:
+            v = v * weights
+        sums = np.bincount(key, weights=v, minlength=2 * n_seg)
+        out[c] = sums[nz] / counts[nz]
+    return pd.DataFrame(out)
+
+
+# Calculamos el código de aceptación: bit i = AcceptedCmp(i+1), bit 5 =
+# Response
+def pack_acceptance(df: pd.DataFrame) -> np.ndarray:
+    code = np.zeros(len(df), dtype=np.uint8)
+    for i, c in enumerate(CMP_COLS + ["Response"]):
+        code |= (df[c].to_numpy() != 0).astype(np.uint8) << i
+    return code
+
+
+# Nombramos un patrón de aceptación por las campañas aceptadas ("C1+C3")
+def pattern_label(p: int) -> str:
+    names = [f"C{i + 1}" for i in range(len(CMP_COLS)) if p >> i & 1]
+    return "+".join(names) if names else "Ninguna"
+
+
+# Contamos clientes y respuestas por patrón de aceptación con un único
+# bincount sobre los códigos filtrados: como Response es el bit alto, las
+# 64 cuentas se reparten en (Response, patrón). Devolvemos los patrones con
+# clientes, en el orden de PATTERN_ORDER. Con `weights` (filas de una
+# muestra) los recuentos son estimaciones redondeadas
+def acceptance_patterns(
+    codes: np.ndarray,
+    weights: np.ndarray | None = None,
+) -> pd.DataFrame:
+    counts = np.bincount(
+        codes, weights=weights, minlength=2 * N_PATTERNS
+    ).reshape(2, -1)
+    if weights is not None:
+        counts = np.round(counts).astype(np.int64)
+    order = np.asarray(PATTERN_ORDER)
+    n0, n1 = counts[0][order], counts[1][order]
+    n = n0 + n1
+    keep = n > 0
+    return pd.DataFrame({
+        "Patron": [pattern_label(p) for p in order[keep]],
+        "Clientes": n[keep],
+        "Aceptan": n1[keep],
+        "Tasa": n1[keep] / n[keep],
+    })
+
+
+# Extraemos una muestra estratificada: repartimos `n_target` filas entre los
+# estratos en proporción a su tamaño, con un mínimo por estrato (o el estrato
+# entero si es menor). Devolvemos las filas ordenadas y el peso de cada una
+# (filas del estrato / filas muestreadas del estrato)
+def stratified_sample(
+    strata: np.ndarray,
+    n_target: int = SAMPLE_ROWS,
+    min_per_stratum: int = SAMPLE_MIN_PER_STRATUM,
+    seed: int = 0,
+) -> tuple:
+    rng = np.random.default_rng(seed)
+    sizes = np.bincount(strata)
+    take = np.ceil(sizes * (n_target / max(strata.size, 1))).astype(np.int64)
+    take = np.minimum(np.maximum(take, min_per_stratum), sizes)
+
+    # Barajamos las filas y las agrupamos por estrato (orden estable): las
+    # primeras `take` de cada estrato forman una muestra aleatoria simple
+    perm = rng.permutation(strata.size)
+    perm = perm[np.argsort(strata[perm], kind="stable")]
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rank = np.arange(strata.size) - np.repeat(starts, sizes)
+    picked = perm[rank < np.repeat(take, sizes)]
+
+    rows = np.sort(picked)
+    s = strata[rows]
+    weights = sizes[s] / take[s]
+    return rows, weights
+
+
+# Precalculamos las muestras de la vista preliminar: una estratificada por
+# Response (clave None) y una por segmentación, estratificada por Response ×
+# segmento
+def build_samples(df: pd.DataFrame, segments: dict) -> dict:
+    resp = df["Response"].to_numpy().astype(np.int64)
+    samples = {None: stratified_sample(resp)}
+    for name, (codes, labels) in segments.items():
+        samples[name] = stratified_sample(resp * len(labels) + codes)
+    return samples
+
+
+# Restringimos una muestra a las filas seleccionadas (ambas ordenadas) y
+# devolvemos sus filas y pesos
+def sample_rows(rows: np.ndarray, sample: tuple) -> tuple:
+    ids, weights = sample
+    if rows.size == 0 or ids.size == 0:
+        return ids[:0], weights[:0]
+    pos = np.searchsorted(rows, ids)
+    np.minimum(pos, rows.size - 1, out=pos)
+    keep = rows[pos] == ids
+    return ids[keep], weights[keep]
@@ -0,0 +1,194 @@
+# Registro de datasets: un mismo servidor atiende varios datasets (uno por
+# marca), elegidos por la URL (?dataset=<nombre>) al abrir la sesión. Los
+# datasets cargados se guardan en una LRU acotada por un presupuesto de
+# memoria; los expulsados se recargan bajo demanda desde su caché de columnas,
+# sin volver a leer ni transformar los CSV.
+#
+# Configuración:
+#   APP_DATASETS="marca_a=datos/a.csv;marca_b=datos/b/"  (fichero, directorio
+#       de shards o patrón glob; el primero es el dataset por defecto)
+#   APP_DATASET_BUDGET_MB=1024   presupuesto de memoria de la LRU
+#   APP_CACHE_DIR=.cache         carpeta de las cachés de columnas
+#   APP_PROGRESSIVE_ROWS=50000   filas filtradas a partir de las cuales se
+#       muestra primero una vista preliminar sobre una muestra
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import parse_qs
+import os
+import sys
+import threading
+import numpy as np
+import pandas as pd
+from data_prep import (
+    load_data,
+    source_key,
+    save_column_cache,
+    load_column_cache,
+    robust_thresholds,
+    build_row_index,
+    build_cohort_index,
+    build_segments,
+    build_samples,
+)
+from neighbors import build_neighbor_index
+from clustering import load_clusters, CLUSTER_K
+
+# Definimos la ruta base del módulo para construir rutas relativas
+HERE = Path(__file__).resolve().parent
+
+
+# Leemos la lista de datasets ("nombre=ruta;nombre=ruta")
+def _parse_datasets(spec: str) -> dict:
+    out = {}
+    for item in spec.split(";"):
+        name, sep, path = item.partition("=")
+        if sep and name.strip() and path.strip():
+            out[name.strip()] = path.strip()
+    return out
+
+
+DATASETS = (
+    _parse_datasets(os.environ.get("APP_DATASETS", ""))
+    or {"marketing": "marketing_campaign.csv"}
+)
+DEFAULT_DATASET = next(iter(DATASETS))
+MEMORY_BUDGET = float(os.environ.get("APP_DATASET_BUDGET_MB", "1024")) * 2**20
+CACHE_DIR = Path(os.environ.get("APP_CACHE_DIR", HERE / ".cache"))
+PROGRESSIVE_ROWS = int(os.environ.get("APP_PROGRESSIVE_ROWS", "50000"))
+
+_loaded = OrderedDict()
+_lock = threading.Lock()
+_building = {}
+_on_load = []
+
+
+# Estimamos la memoria ocupada por un dataset y sus índices
+def _nbytes(obj) -> int:
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sum(_nbytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(_nbytes(v) for v in obj)
+    return 0
+
+
+# Leemos el DataFrame desde la caché de columnas si está al día; si no, desde
+# los CSV, y regeneramos la caché. Devolvemos también la huella de la versión
+# de los datos
+def read_dataset(name: str) -> tuple:
+    path = DATASETS[name]
+    key = source_key(path)
+    cache_dir = CACHE_DIR / name
+    df = load_column_cache(cache_dir, key)
+    if df is not None:
+        return df, key
+
+    df = load_data(path, features=True)
+    try:
+        save_column_cache(df, cache_dir, key)
+    except OSError as e:
+        print(f"No se pudo guardar la caché de {name}: {e}", file=sys.stderr)
+    return df, key
+
+
+# Construimos todo lo que la App necesita de un dataset: los datos, los
+# umbrales robustos, los índices precalculados y los límites de la interfaz
+def _build(name: str) -> dict:
+    df, key = read_dataset(name)
+    thr = robust_thresholds(df)
+    cohort = build_cohort_index(df)
+    segments = build_segments(df)
+
+    # Añadimos los clústeres precalculados (clustering.py) si existen para
+    # esta versión de los datos
+    clusters = load_clusters(CACHE_DIR / name, key, CLUSTER_K)
+    if clusters is not None and clusters[0].size == len(df):
+        labels = clusters[0].astype(np.int32)
+        segments["Cluster"] = (
+            labels,
+            [f"Clúster {i + 1}" for i in range(clusters[1].shape[0])],
+        )
+
+    ds = {
+        "name": name,
+        "version": key,
+        "df": df,
+        "thr": thr,
+
+        # Índices de filas para traducir las selecciones gráficas (brushing)
+        "row_index": build_row_index(df, ("Income",)),
+
+        # Índice de cohortes por mes de alta y códigos de segmentación
+        "cohort": cohort,
+        "segments": segments,
+
+        # KD-tree de clientes similares
+        "neighbors": build_neighbor_index(df),
+
+        # Muestras estratificadas de la vista preliminar (solo si el dataset
+        # puede superar el umbral de filas)
+        "samples": (
+            build_samples(df, segments) if len(df) > PROGRESSIVE_ROWS else {}
+        ),
+
+        # Límites de los sliders de la interfaz
+        "bounds": {
+            "recency_max": int(df["Recency"].max()),
+            "income_max": int(thr["inc_p995"]),
+            "spend_max": int(df["TotalSpend"].max()),
+            "cohort_min": cohort["months"][0].astype("datetime64[D]").item(),
+            "cohort_max": cohort["months"][-1].astype("datetime64[D]").item(),
+        },
+    }
+    ds["nbytes"] = _nbytes(ds)
+    return ds
+
+
+# Registramos una función que recibe cada dataset recién construido (p. ej.
+# el precálculo de arranque); debe volver enseguida, porque se llama con el
+# cerrojo de construcción de ese dataset tomado
+def on_load(fn) -> None:
+    _on_load.append(fn)
+
+
+# Devolvemos el dataset pedido (cargándolo si no está en memoria) y
+# expulsamos los menos usados recientemente hasta respetar el presupuesto.
+# El dataset recién pedido nunca se expulsa, aunque supere el presupuesto.
+# La construcción se hace fuera del cerrojo del registro, con un cerrojo por
+# dataset: una marca que se está cargando no bloquea las consultas de las
+# demás, y dos peticiones de la misma marca no la construyen dos veces
+def get_dataset(name: str = DEFAULT_DATASET) -> dict:
+    with _lock:
+        ds = _loaded.get(name)
+        if ds is not None:
+            _loaded.move_to_end(name)
+            return ds
+        building = _building.setdefault(name, threading.Lock())
+
+    with building:
+        with _lock:
+            ds = _loaded.get(name)
+            if ds is not None:
+                _loaded.move_to_end(name)
+                return ds
+
+        ds = _build(name)
+        with _lock:
+            _loaded[name] = ds
+            used = sum(d["nbytes"] for d in _loaded.values())
+            while used > MEMORY_BUDGET and len(_loaded) > 1:
+                _, old = _loaded.popitem(last=False)
+                used -= old["nbytes"]
+        for fn in _on_load:
+            fn(ds)
+        return ds
+
+
+# Elegimos el dataset a partir de la cadena de consulta de la URL; si no se
+# indica o no existe, usamos el dataset por defecto
+def dataset_from_query(query: str) -> str:
+    name = parse_qs(query.lstrip("?")).get("dataset", [""])[0]
+    return name if name in DATASETS else DEFAULT_DATASET
@@ -0,0 +1,109 @@
+# Exportación de las filas filtradas: generamos el fichero por bloques de
+# filas a partir de la selección del motor de filtros (posiciones de fila),
+# de modo que la memoria no crece con el tamaño de la exportación y los
+# primeros bytes se envían en cuanto está listo el primer bloque
+import numpy as np
+import pandas as pd
+
+# Usamos pyarrow para Parquet si está instalado; si no, solo ofrecemos CSV
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+# Número de filas por bloque (y por grupo de filas en Parquet)
+EXPORT_CHUNK_ROWS = 50_000
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+# Convertimos una sola vez las columnas exportadas a arrays de NumPy (las
+# columnas de texto de pandas se convierten entero en cada to_numpy) y
+# extraemos de ellos cada bloque
+def _column_arrays(df: pd.DataFrame, cols: list) -> dict:
+    return {c: df[c].to_numpy() for c in cols}
+
+
+def _take(arrays: dict, rows: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame(
+        {c: a[rows] for c, a in arrays.items()},
+        copy=False,
+    )
+
+
+# Generamos el CSV por bloques; solo el primero lleva la cabecera
+def iter_csv(
+    df: pd.DataFrame,
+    rows: np.ndarray,
+    cols: list,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+):
+    if rows.size == 0:
+        yield pd.DataFrame(columns=cols).to_csv(index=False)
+        return
+    arrays = _column_arrays(df, cols)
+    for s in range(0, rows.size, chunk_rows):
+        part = _take(arrays, rows[s:s + chunk_rows])
+        yield part.to_csv(index=False, header=(s == 0))
+
+
+# Destino de escritura que acumula lo escrito hasta que lo recogemos
+class _ChunkSink:
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        out = b"".join(self.parts)
+        self.parts = []
+        return out
+
+
+# Generamos el Parquet por grupos de filas: escribimos cada bloque con el
+# mismo esquema y enviamos los bytes producidos hasta ese momento; el pie
+# del fichero se envía al cerrar el escritor
+def iter_parquet(
+    df: pd.DataFrame,
+    rows: np.ndarray,
+    cols: list,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+):
+    arrays = _column_arrays(df, cols)
+    schema = pa.Schema.from_pandas(
+        _take(arrays, rows[:1]), preserve_index=False
+    )
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+    try:
+        for s in range(0, rows.size, chunk_rows):
+            part = _take(arrays, rows[s:s + chunk_rows])
+            writer.write_table(
+                pa.Table.from_pandas(part, schema=schema, preserve_index=False)
+            )
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def iter_export(df: pd.DataFrame, rows: np.ndarray, cols: list, fmt: str):
+    if fmt == "parquet" and HAS_PARQUET:
+        return iter_parquet(df, rows, cols)
+    return iter_csv(df, rows, cols)
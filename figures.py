@@ -0,0 +1,172 @@
+# Fábrica de figuras: construimos con plotly express, una sola vez por vista
+# y estructura (segmentación, grupos presentes, título), el layout, el mapa de
+# colores y las trazas; en cada render solo rellenamos los datos de las
+# trazas y creamos la figura sin volver a validarla
+from collections import OrderedDict
+import copy
+import threading
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+# Limitamos el número de esqueletos guardados (p. ej. la evolución mensual
+# genera uno por rango de meses)
+MAX_SKELETONS = 256
+
+# Umbral de filas a partir del cual plotly express usa WebGL en modo "auto"
+PX_WEBGL_ROWS = 1000
+
+_skeletons = OrderedDict()
+_lock = threading.Lock()
+
+
+# Recuperamos un esqueleto de la caché (LRU) o lo construimos. La caché se
+# comparte con los hilos del precálculo de arranque (warmup.py); la
+# construcción ocurre fuera del cerrojo
+def _get_skeleton(key: tuple, build):
+    with _lock:
+        sk = _skeletons.get(key)
+        if sk is not None:
+            _skeletons.move_to_end(key)
+            return sk
+
+    sk = build()
+    with _lock:
+        _skeletons[key] = sk
+        if len(_skeletons) > MAX_SKELETONS:
+            _skeletons.popitem(last=False)
+    return sk
+
+
+# Convertimos la figura de plotly express en un esqueleto: el JSON del
+# layout y, por traza, su JSON sin datos
+def _to_skeleton(fig: go.Figure, attrs: list) -> dict:
+    spec = fig.to_plotly_json()
+    traces = []
+    for tr in spec["data"]:
+        tr = dict(tr)
+        for a in attrs:
+            tr.pop(a, None)
+        traces.append(tr)
+    return {"layout": spec["layout"], "traces": traces}
+
+
+# Creamos la figura final a partir del esqueleto y los datos de cada traza.
+# Copiamos el layout para que los añadidos de cada render (anotaciones,
+# líneas, bins) no modifiquen el esqueleto compartido
+def _assemble(sk: dict, data: list, widget: bool) -> go.Figure:
+    traces = [{**tr, **d} for tr, d in zip(sk["traces"], data)]
+    fig_cls = go.FigureWidget if widget else go.Figure
+    return fig_cls(
+        {"data": traces, "layout": copy.deepcopy(sk["layout"])},
+        _validate=False,
+    )
+
+
+def _key_values(g: pd.DataFrame, cols: list) -> tuple:
+    return tuple((c, tuple(g[c].tolist())) for c in cols)
+
+
+# Figura a partir de una tabla agregada (barras, mapas de calor, líneas):
+# `fill` asocia cada atributo de traza ("y", "z"...) con su columna de
+# valores. El esqueleto depende de las columnas restantes (ejes, color,
+# facetas), así que se reutiliza mientras los grupos sean los mismos
+def table_figure(
+    name: str,
+    g: pd.DataFrame,
+    fill: dict,
+    px_fn,
+    style=None,
+    widget: bool = False,
+    **px_kwargs,
+) -> go.Figure:
+    key_cols = [c for c in g.columns if c not in fill.values()]
+    key = (name, px_kwargs.get("title"), _key_values(g, key_cols))
+
+    # Construimos el esqueleto con una plantilla cuyas columnas de valores
+    # contienen el número de fila: así cada traza indica qué filas contiene
+    def build():
+        tmpl = g.copy()
+        for col in fill.values():
+            tmpl[col] = np.arange(len(g), dtype=float)
+        fig = px_fn(tmpl, **px_kwargs)
+        if style is not None:
+            style(fig)
+        ids = [
+            {a: np.asarray(tr[a], dtype=np.int64) for a in fill}
+            for tr in fig.data
+        ]
+        sk = _to_skeleton(fig, list(fill))
+        sk["ids"] = ids
+        return sk
+
+    sk = _get_skeleton(key, build)
+    values = {a: g[col].to_numpy() for a, col in fill.items()}
+    data = [
+        {a: values[a][rows[a]] for a in fill}
+        for rows in sk["ids"]
+    ]
+    return _assemble(sk, data, widget)
+
+
+# Figura a partir de filas individuales (histogramas, boxplots, dispersión):
+# hay una traza por valor de `group` (o una sola si es None) y `fill` asocia
+# cada atributo de traza con su columna
+def grouped_figure(
+    name: str,
+    d: pd.DataFrame,
+    fill: dict,
+    px_fn,
+    group: str | None = None,
+    style=None,
+    widget: bool = False,
+    **px_kwargs,
+) -> go.Figure:
+    if group is None:
+        labels = np.zeros(len(d), dtype=np.int8)
+        groups = (0,)
+    else:
+        labels = d[group].to_numpy()
+        groups = tuple(pd.unique(labels).tolist())
+
+    # La plantilla tiene pocas filas: fijamos el modo de renderizado que
+    # plotly express elegiría con los datos reales
+    if px_fn in (px.scatter, px.line) and "render_mode" not in px_kwargs:
+        px_kwargs["render_mode"] = (
+            "webgl" if len(d) > PX_WEBGL_ROWS else "svg"
+        )
+    key = (
+        name,
+        px_kwargs.get("title"),
+        px_kwargs.get("render_mode"),
+        groups,
+    )
+
+    # Construimos el esqueleto con una fila por grupo, en orden de aparición
+    def build():
+        first = np.unique(labels, return_index=True)[1] if len(d) else []
+        fig = px_fn(d.iloc[np.sort(first)], **px_kwargs)
+        if style is not None:
+            style(fig)
+        sk = _to_skeleton(fig, list(fill))
+        sk["groups"] = [
+            groups[0] if group is None else tr.name for tr in fig.data
+        ]
+        return sk
+
+    sk = _get_skeleton(key, build)
+    data = []
+    for gv in sk["groups"]:
+        mask = labels == gv if len(groups) > 1 else slice(None)
+        data.append({a: d[col].to_numpy()[mask] for a, col in fill.items()})
+    return _assemble(sk, data, widget)
+
+
+# Figura vacía con un mensaje en el título (sin datos, errores)
+def empty_figure(title: str) -> go.Figure:
+    sk = _get_skeleton(
+        ("empty", title, ()),
+        lambda: _to_skeleton(px.scatter(title=title), []),
+    )
+    return _assemble(sk, [{} for _ in sk["traces"]], False)
@@ -0,0 +1,342 @@
+# Herramienta de prueba de carga: arrancamos la App localmente y simulamos N
+# sesiones concurrentes por websocket que cambian los filtros como lo haría un
+# analista. Medimos el tiempo hasta la última actualización de salidas de cada
+# interacción y reportamos p50/p95/p99 y el throughput según crece N.
+#
+# Uso:
+#   python loadtest.py --sessions 1 4 16 32 --interactions 20
+#   python loadtest.py --url http://127.0.0.1:8000 --sessions 8
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+from pathlib import Path
+
+import numpy as np
+import websockets
+
+# Definimos la ruta base del módulo para arrancar la App desde su directorio
+HERE = Path(__file__).resolve().parent
+
+# Definimos los límites de espera (segundos) para el arranque y cada respuesta
+STARTUP_TIMEOUT = 60.0
+FLUSH_TIMEOUT = 60.0
+
+
+# Extraemos del HTML de la App los identificadores de las salidas y los
+# valores iniciales de los filtros, para no duplicar aquí la definición de la
+# interfaz (y respetar los límites de cada dataset)
+class _UIParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.outputs = []
+        self.sliders = {}
+        self.selects = {}
+        self.buttons = []
+        self._select = None
+
+    def handle_starttag(self, tag, attrs):
+        a = dict(attrs)
+        cls = (a.get("class") or "").split()
+        el_id = a.get("id")
+
+        if el_id and any(
+            c.startswith("shiny-") and c.endswith("-output") for c in cls
+        ):
+            self.outputs.append(el_id)
+        elif el_id and "js-range-slider" in cls:
+            self.sliders[el_id] = {
+                "min": float(a["data-min"]),
+                "max": float(a["data-max"]),
+                "value": [float(a["data-from"]), float(a["data-to"])],
+                "type": a.get("data-data-type", "number"),
+            }
+        elif el_id and "action-button" in cls:
+            self.buttons.append(el_id)
+        elif tag == "select" and el_id:
+            self._select = el_id
+            self.selects[el_id] = {"choices": [], "value": None}
+        elif tag == "option" and self._select is not None:
+            sel = self.selects[self._select]
+            sel["choices"].append(a.get("value"))
+            if "selected" in a:
+                sel["value"] = a.get("value")
+
+    def handle_endtag(self, tag):
+        if tag == "select":
+            sel = self.selects.get(self._select)
+            if sel is not None and sel["value"] is None and sel["choices"]:
+                sel["value"] = sel["choices"][0]
+            self._select = None
+
+
+def read_ui(base_url: str) -> _UIParser:
+    with urllib.request.urlopen(base_url + "/", timeout=30) as r:
+        html = r.read().decode("utf-8")
+    parser = _UIParser()
+    parser.feed(html)
+    return parser
+
+
+# Arrancamos la App en un subproceso para que clientes y servidor no compitan
+# por el mismo intérprete
+def start_server(port: int) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=str(HERE),
+    )
+
+    base_url = f"http://127.0.0.1:{port}"
+    t_end = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < t_end:
+        if proc.poll() is not None:
+            raise RuntimeError("La App terminó durante el arranque")
+        try:
+            urllib.request.urlopen(base_url + "/", timeout=2).close()
+            return proc
+        except OSError:
+            time.sleep(0.25)
+
+    proc.terminate()
+    raise RuntimeError("La App no respondió en el tiempo de arranque")
+
+
+# Controles que mueve el analista simulado: los filtros que afectan a las
+# vistas (incluido el periodo de alta) y el botón “reset”. El resto de
+# controles de la página (exportación, clientes similares) no actualizan
+# vistas y solo añadirían flushes vacíos a las medidas
+SLIDER_INPUTS = ("recency", "income", "spend_range", "cohort")
+SELECT_INPUTS = ("response", "seg_var")
+RESET_INPUT = "reset"
+
+
+# Generamos un subrango aleatorio (entero) dentro de los límites del slider
+def _random_range(rng: random.Random, lo: float, hi: float) -> list:
+    a, b = sorted(rng.uniform(lo, hi) for _ in range(2))
+    return [int(a), int(max(b, a + 1))]
+
+
+# Construimos una interacción realista: arrastres de sliders (varios valores
+# intermedios seguidos), cambios de selección o un clic en “reset”
+def make_interaction(rng: random.Random, ui_spec: _UIParser,
+                     clicks: dict) -> list:
+    kinds = ["slider"] * 6 + ["select"] * 3 + ["reset"]
+    kind = rng.choice(kinds)
+
+    sliders = [k for k in SLIDER_INPUTS if k in ui_spec.sliders]
+    selects = [k for k in SELECT_INPUTS if k in ui_spec.selects]
+
+    if kind == "slider" and sliders:
+        sid = rng.choice(sliders)
+        spec = ui_spec.sliders[sid]
+        steps = rng.randint(1, 4)
+        return [{sid: _random_range(rng, spec["min"], spec["max"])}
+                for _ in range(steps)]
+
+    if kind == "select" and selects:
+        sid = rng.choice(selects)
+        return [{sid: rng.choice(ui_spec.selects[sid]["choices"])}]
+
+    if RESET_INPUT in clicks:
+        clicks[RESET_INPUT] += 1
+        return [{RESET_INPUT: clicks[RESET_INPUT]}]
+
+    return [{}]
+
+
+# Codificamos los valores como los envía el navegador: los sliders de fechas
+# viajan como fechas ISO con el tipo “shiny.date” (internamente usamos ms) y
+# los botones con el tipo “shiny.action”
+def _encode(ui_spec: _UIParser, upd: dict) -> dict:
+    out = {}
+    for k, v in upd.items():
+        spec = ui_spec.sliders.get(k)
+        if k in ui_spec.buttons:
+            out[f"{k}:shiny.action"] = v
+        elif spec is not None and spec["type"] == "date":
+            out[f"{k}:shiny.date"] = [
+                datetime.fromtimestamp(x / 1000, timezone.utc)
+                .strftime("%Y-%m-%d")
+                for x in v
+            ]
+        else:
+            out[k] = v
+    return out
+
+
+# Leemos mensajes hasta el final de un ciclo reactivo: el servidor envía un
+# mensaje “values” al terminar cada flush, con los inputMessages pendientes
+async def _await_flush(ws) -> tuple:
+    busy = False
+    while True:
+        msg = json.loads(await asyncio.wait_for(ws.recv(), FLUSH_TIMEOUT))
+        if "busy" in msg:
+            busy = msg["busy"] == "busy"
+        if "values" in msg and not busy:
+            return msg.get("inputMessages", []), msg.get("errors", {})
+
+
+# Reenviamos al servidor los valores que este ha actualizado (p. ej. tras un
+# reset), como haría el navegador, y devolvemos cuántos mensajes se enviaron
+async def _echo_inputs(ws, ui_spec: _UIParser, state: dict,
+                       input_msgs: list) -> int:
+    upd = {}
+    for m in input_msgs:
+        value = m.get("message", {}).get("value")
+        if value is None:
+            continue
+        if isinstance(value, list) and isinstance(state.get(m["id"]), str):
+            value = value[0] if value else None
+        if state.get(m["id"]) != value:
+            upd[m["id"]] = value
+
+    if not upd:
+        return 0
+    state.update(upd)
+    await ws.send(json.dumps(
+        {"method": "update", "data": _encode(ui_spec, upd)}
+    ))
+    return 1
+
+
+# Simulamos una sesión: inicializamos, esperamos al primer render y
+# ejecutamos la secuencia de interacciones registrando su latencia
+async def run_session(ws_url: str, ui_spec: _UIParser, n_interactions: int,
+                      think: float, seed: int, latencies: list,
+                      errors: list) -> None:
+    rng = random.Random(seed)
+    state = {k: v["value"] for k, v in ui_spec.sliders.items()}
+    state.update({k: v["value"] for k, v in ui_spec.selects.items()})
+    clicks = {b: 0 for b in ui_spec.buttons}
+    state.update(clicks)
+
+    init = _encode(ui_spec, state)
+    init.update(
+        {f".clientdata_output_{o}_hidden": False for o in ui_spec.outputs}
+    )
+
+    # Desactivamos el ping de keepalive: con el servidor saturado no debe
+    # contarse como error lo que es precisamente la latencia a medir
+    async with websockets.connect(ws_url, max_size=None,
+                                  ping_interval=None) as ws:
+        await ws.send(json.dumps({"method": "init", "data": init}))
+
+        # El arranque de la sesión puede producir varios flushes: esperamos a
+        # que el servidor quede en reposo antes de empezar a medir
+        await _await_flush(ws)
+        while True:
+            try:
+                await asyncio.wait_for(ws.recv(), 0.5)
+            except asyncio.TimeoutError:
+                break
+
+        for _ in range(n_interactions):
+            await asyncio.sleep(rng.expovariate(1.0 / think) if think else 0)
+            steps = make_interaction(rng, ui_spec, clicks)
+
+            t0 = time.perf_counter()
+            pending = 0
+            for upd in steps:
+                state.update(upd)
+                await ws.send(json.dumps(
+                    {"method": "update", "data": _encode(ui_spec, upd)}
+                ))
+                pending += 1
+                await asyncio.sleep(0.03 if len(steps) > 1 else 0)
+
+            # Cada mensaje enviado produce un flush; la interacción termina
+            # con el último (incluidos los reenvíos tras un reset)
+            while pending:
+                input_msgs, errs = await _await_flush(ws)
+                pending -= 1
+                pending += await _echo_inputs(ws, ui_spec, state,
+                                              input_msgs)
+                if errs:
+                    errors.append(errs)
+
+            latencies.append(time.perf_counter() - t0)
+
+
+async def run_level(ws_url: str, ui_spec: _UIParser, n_sessions: int,
+                    n_interactions: int, think: float, seed: int) -> dict:
+    latencies, errors = [], []
+    t0 = time.perf_counter()
+    await asyncio.gather(*[
+        run_session(ws_url, ui_spec, n_interactions, think, seed + i,
+                    latencies, errors)
+        for i in range(n_sessions)
+    ])
+    wall = time.perf_counter() - t0
+
+    lat = np.asarray(latencies) * 1000.0
+    p50, p95, p99 = np.percentile(lat, [50, 95, 99]) if lat.size else [0] * 3
+    return {
+        "sessions": n_sessions,
+        "interactions": int(lat.size),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "throughput_per_s": float(lat.size / wall) if wall else 0.0,
+        "errors": len(errors),
+    }
+
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Prueba de carga de sesiones concurrentes de la App",
+    )
+    parser.add_argument("--url", default=None,
+                        help="URL de una App ya arrancada (si no, se arranca)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--sessions", type=int, nargs="+",
+                        default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--interactions", type=int, default=20,
+                        help="Interacciones por sesión")
+    parser.add_argument("--think", type=float, default=0.5,
+                        help="Tiempo medio (s) entre interacciones")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None,
+                        help="Ruta donde guardar los resultados en JSON")
+    args = parser.parse_args(argv)
+
+    proc = None
+    base_url = args.url
+    if base_url is None:
+        proc = start_server(args.port)
+        base_url = f"http://127.0.0.1:{args.port}"
+    base_url = base_url.rstrip("/")
+    ws_url = "ws" + base_url[len("http"):] + "/websocket/"
+
+    try:
+        ui_spec = read_ui(base_url)
+        results = []
+        print(f"{'N':>4} {'interacc.':>9} {'p50 ms':>9} {'p95 ms':>9} "
+              f"{'p99 ms':>9} {'interacc./s':>11} {'errores':>7}")
+        for n in args.sessions:
+            res = asyncio.run(run_level(ws_url, ui_spec, n, args.interactions,
+                                        args.think, args.seed))
+            results.append(res)
+            print(f"{n:>4} {res['interactions']:>9} {res['p50_ms']:>9.1f} "
+                  f"{res['p95_ms']:>9.1f} {res['p99_ms']:>9.1f} "
+                  f"{res['throughput_per_s']:>11.2f} {res['errors']:>7}")
+
+        if args.json:
+            Path(args.json).write_text(json.dumps(results, indent=2))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# Búsqueda de clientes similares: construimos al cargar el dataset un KD-tree
+# (en NumPy) sobre las variables estandarizadas de cada cliente y resolvemos
+# cada consulta de k vecinos visitando solo los nodos cuya caja puede
+# contener un vecino más cercano que los ya encontrados
+import heapq
+import numpy as np
+import pandas as pd
+from data_prep import SPEND_COLS, PURCHASE_COLS
+
+# Variables de similitud: nivel (ingresos, gasto, recencia), canales de
+# compra y cuotas de gasto por categoría
+NEIGHBOR_COLS = ["Income", "TotalSpend", "Recency"] + PURCHASE_COLS
+
+# Número máximo de clientes por hoja del árbol
+LEAF_SIZE = 32
+
+# Con pocos candidatos (filtro muy restrictivo) comparamos directamente con
+# todos ellos en lugar de recorrer el árbol
+BRUTE_FORCE_ROWS = 512
+
+
+# Construimos la matriz estandarizada (media 0, desviación 1 por columna).
+# Los ingresos ausentes se imputan con la mediana y las cuotas de clientes
+# sin gasto quedan a 0
+def feature_matrix(df: pd.DataFrame) -> np.ndarray:
+    cols = [df[c].to_numpy(dtype=float) for c in NEIGHBOR_COLS]
+    cols[0] = np.where(np.isnan(cols[0]), np.nanmedian(cols[0]), cols[0])
+
+    tot = df["TotalSpend"].to_numpy(dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for c in SPEND_COLS:
+            cols.append(np.where(tot > 0, df[c].to_numpy() / tot, 0.0))
+
+    X = np.column_stack(cols)
+    sd = X.std(axis=0)
+    return (X - X.mean(axis=0)) / np.where(sd > 0, sd, 1.0)
+
+
+# Construimos el índice: matriz estandarizada, KD-tree (permutación de filas
+# y, por nodo, su rango en la permutación, hijos y caja envolvente) y el
+# índice ordenado de ID de cliente
+def build_neighbor_index(df: pd.DataFrame) -> dict:
+    X = feature_matrix(df)
+    n, d = X.shape
+    perm = np.arange(n, dtype=np.int64)
+
+    start, end, left, right, lo, hi = [], [], [], [], [], []
+    stack = [(0, n, -1, 0)]
+    while stack:
+        s, e, parent, side = stack.pop()
+        node = len(start)
+        if parent >= 0:
+            (left if side == 0 else right)[parent] = node
+        pts = X[perm[s:e]]
+        start.append(s)
+        end.append(e)
+        left.append(-1)
+        right.append(-1)
+        lo.append(pts.min(axis=0) if e > s else np.zeros(d))
+        hi.append(pts.max(axis=0) if e > s else np.zeros(d))
+
+        # Dividimos por la mediana de la dimensión con mayor amplitud
+        if e - s > LEAF_SIZE:
+            dim = int(np.argmax(hi[node] - lo[node]))
+            if hi[node][dim] > lo[node][dim]:
+                mid = (e - s) // 2
+                part = np.argpartition(pts[:, dim], mid)
+                perm[s:e] = perm[s:e][part]
+                stack.append((s + mid, e, node, 1))
+                stack.append((s, s + mid, node, 0))
+
+    ids = df["ID"].to_numpy()
+    id_order = np.argsort(ids, kind="stable")
+    return {
+        "X": X,
+        "perm": perm,
+        "start": np.asarray(start),
+        "end": np.asarray(end),
+        "left": np.asarray(left),
+        "right": np.asarray(right),
+        "lo": np.asarray(lo),
+        "hi": np.asarray(hi),
+        "id_order": id_order,
+        "id_sorted": ids[id_order],
+    }
+
+
+# Devolvemos la fila del cliente con el ID dado (o None si no existe)
+def row_of_id(index: dict, customer_id: int) -> int | None:
+    ids = index["id_sorted"]
+    pos = np.searchsorted(ids, customer_id)
+    if pos < ids.size and ids[pos] == customer_id:
+        return int(index["id_order"][pos])
+    return None
+
+
+# Mezclamos los candidatos nuevos con los k mejores actuales
+def _merge(best_d, best_i, d, i, k):
+    all_d = np.concatenate([best_d, d])
+    all_i = np.concatenate([best_i, i])
+    if all_d.size > k:
+        keep = np.argpartition(all_d, k - 1)[:k]
+        all_d, all_i = all_d[keep], all_i[keep]
+    return all_d, all_i
+
+
+# Buscamos los k clientes más cercanos a la fila `row` (excluida ella misma).
+# Si se indica `allowed` (máscara booleana por fila), solo se consideran esas
+# filas; `allowed_rows` son esas mismas filas ya enumeradas (p. ej. la
+# selección del filtro) y evitan recorrer la máscara en cada consulta para
+# contarlas. Devolvemos (filas, distancias) ordenadas de menor a mayor
+# distancia
+def nearest(
+    index: dict,
+    row: int,
+    k: int,
+    allowed: np.ndarray | None = None,
+    allowed_rows: np.ndarray | None = None,
+) -> tuple:
+    X = index["X"]
+    q = X[row]
+    if allowed is not None and allowed_rows is None:
+        allowed_rows = np.flatnonzero(allowed)
+
+    # Con pocos candidatos, comparación directa
+    if allowed is not None and allowed_rows.size <= BRUTE_FORCE_ROWS:
+        cand = allowed_rows
+        cand = cand[cand != row]
+        d2 = ((X[cand] - q) ** 2).sum(axis=1)
+        best_d, best_i = _merge(np.empty(0), np.empty(0, np.int64),
+                                d2, cand, k)
+    else:
+        best_d, best_i = np.empty(0), np.empty(0, np.int64)
+        perm, lo, hi = index["perm"], index["lo"], index["hi"]
+        left, right = index["left"], index["right"]
+        heap = [(0.0, 0)]
+        while heap:
+            bound, node = heapq.heappop(heap)
+            if best_d.size == k and bound >= best_d.max():
+                break
+
+            if left[node] < 0:
+                cand = perm[index["start"][node]:index["end"][node]]
+                if allowed is not None:
+                    cand = cand[allowed[cand]]
+                cand = cand[cand != row]
+                if cand.size:
+                    d2 = ((X[cand] - q) ** 2).sum(axis=1)
+                    best_d, best_i = _merge(best_d, best_i, d2, cand, k)
+                continue
+
+            # Distancia mínima (al cuadrado) del punto a la caja de cada hijo
+            for child in (left[node], right[node]):
+                gap = np.maximum(lo[child] - q, 0.0) + np.maximum(
+                    q - hi[child], 0.0
+                )
+                heapq.heappush(heap, (float(gap @ gap), int(child)))
+
+    order = np.argsort(best_d, kind="stable")
+    return best_i[order], np.sqrt(best_d[order])
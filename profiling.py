@@ -0,0 +1,239 @@
+# Captura de perfiles bajo demanda: cuando una sesión tiene el perfilado
+# activo, medimos cada ciclo reactivo completo (desde la primera ejecución
+# instrumentada hasta que los mensajes se han enviado al navegador), así el
+# perfil reparte el tiempo entre pandas, la serialización de plotly y el envío
+# por websocket. Cada captura se etiqueta con el estado de los filtros.
+#
+# Activación:
+#   APP_PROFILE=sample|cprofile      perfila todas las sesiones
+#   APP_PROFILE_TOKEN=<token>        permite ?profile=<token> en la URL
+#                                    (opcional: &profile_mode=cprofile)
+#   APP_PROFILE_DIR, APP_PROFILE_KEEP  carpeta de salida y capturas a conservar
+#
+# Salida por captura (prefijo común <fecha>-<sesión>-<n>):
+#   .folded  pilas colapsadas (modo "sample"; flamegraph.pl, speedscope)
+#   .prof    estadísticas de cProfile (modo "cprofile"; snakeviz, flameprof)
+#   .json    estado de filtros, duración total y tiempos de cada función
+from collections import Counter
+from pathlib import Path
+from time import perf_counter
+from urllib.parse import parse_qs
+import cProfile
+import functools
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+
+from shiny import reactive
+from shiny.session import get_current_session
+
+# Definimos la ruta base del módulo para construir rutas relativas
+HERE = Path(__file__).resolve().parent
+
+MODES = ("sample", "cprofile")
+PROFILE_MODE = os.environ.get("APP_PROFILE", "").strip().lower()
+PROFILE_TOKEN = os.environ.get("APP_PROFILE_TOKEN", "")
+PROFILE_DIR = Path(os.environ.get("APP_PROFILE_DIR", HERE / "profiles"))
+PROFILE_KEEP = int(os.environ.get("APP_PROFILE_KEEP", "100"))
+
+# Intervalo de muestreo (s) del perfilador por muestreo
+SAMPLE_INTERVAL = 0.002
+
+# Sesiones con perfilado activo y sesión con una captura en curso (una sola a
+# la vez: cProfile no admite perfiles simultáneos y las muestras se
+# mezclarían)
+_sessions = {}
+_active = None
+_lock = threading.Lock()
+
+
+# Perfilador por muestreo: un hilo lee periódicamente la pila del hilo que
+# ejecuta la App y cuenta las pilas colapsadas ("mod:func;mod:func")
+class _Sampler(threading.Thread):
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_collapse(frame)] += 1
+
+    def stop(self) -> Counter:
+        self._done.set()
+        self.join()
+        return self.stacks
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        mod = frame.f_globals.get("__name__", "?")
+        names.append(f"{mod}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+# Decidimos el modo de perfilado de la sesión: el global si está definido o
+# el de la URL si incluye el token de administración
+def _session_mode(session) -> str | None:
+    if PROFILE_MODE in MODES:
+        return PROFILE_MODE
+    if PROFILE_MODE not in ("", "0", "false", "no"):
+        return "sample"
+    if not PROFILE_TOKEN:
+        return None
+
+    search_id = ".clientdata_url_search"
+    with reactive.isolate():
+        search = (
+            (session.input[search_id]() or "")
+            if search_id in session.input else ""
+        )
+    qs = parse_qs(search.lstrip("?"))
+    token = qs.get("profile", [""])[0]
+    if not hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode()):
+        return None
+    mode = qs.get("profile_mode", ["sample"])[0]
+    return mode if mode in MODES else "sample"
+
+
+# Registramos la sesión si debe perfilarse; `state_fn` devuelve el estado de
+# los filtros con el que se etiqueta cada captura
+def attach(session, state_fn) -> None:
+    mode = _session_mode(session)
+    if mode is None:
+        return
+    _sessions[session.id] = {
+        "mode": mode,
+        "state": state_fn,
+        "capture": None,
+        "seq": 0,
+    }
+    session.on_ended(lambda: _detach(session.id))
+
+
+# Cerramos la captura pendiente (si la sesión termina a mitad de un ciclo) y
+# olvidamos la sesión
+def _detach(session_id: str) -> None:
+    _finish(session_id)
+    _sessions.pop(session_id, None)
+
+
+# Iniciamos una captura al comienzo del ciclo reactivo y programamos su
+# cierre para cuando la sesión haya enviado los mensajes
+def _begin(session, prof: dict) -> dict | None:
+    global _active
+    if prof["capture"] is not None:
+        return prof["capture"]
+    with _lock:
+        if _active is not None:
+            return None
+        _active = session.id
+
+    cap = {"t0": perf_counter(), "spans": []}
+    if prof["mode"] == "cprofile":
+        cap["engine"] = cProfile.Profile()
+        cap["engine"].enable()
+    else:
+        cap["engine"] = _Sampler(threading.get_ident())
+        cap["engine"].start()
+    prof["capture"] = cap
+    session.on_flushed(lambda: _finish(session.id), once=True)
+    return cap
+
+
+def _finish(session_id: str) -> None:
+    global _active
+    prof = _sessions.get(session_id)
+    cap = prof["capture"] if prof is not None else None
+    if cap is None:
+        return
+
+    wall = perf_counter() - cap["t0"]
+    if prof["mode"] == "cprofile":
+        cap["engine"].disable()
+    else:
+        cap["stacks"] = cap["engine"].stop()
+    prof["capture"] = None
+    with _lock:
+        _active = None
+
+    prof["seq"] += 1
+    try:
+        with reactive.isolate():
+            state = prof["state"]()
+    except Exception as e:
+        state = {"error": repr(e)}
+    try:
+        _write(session_id, prof, cap, wall, state)
+    except OSError as e:
+        print(f"No se pudo guardar el perfil: {e}", file=sys.stderr)
+
+
+def _write(session_id: str, prof: dict, cap: dict, wall: float,
+           state: dict) -> None:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    stem = (
+        f"{time.strftime('%Y%m%d-%H%M%S')}-{session_id[:8]}-"
+        f"{prof['seq']:05d}"
+    )
+    base = PROFILE_DIR / stem
+
+    if prof["mode"] == "cprofile":
+        cap["engine"].dump_stats(str(base) + ".prof")
+    else:
+        with open(str(base) + ".folded", "w", encoding="utf-8") as f:
+            for stack, n in cap["stacks"].most_common():
+                f.write(f"{stack} {n}\n")
+
+    meta = {
+        "session": session_id,
+        "mode": prof["mode"],
+        "state": state,
+        "wall_ms": round(wall * 1000.0, 3),
+        "spans": [
+            {"name": name, "ms": round(ms, 3)} for name, ms in cap["spans"]
+        ],
+    }
+    with open(str(base) + ".json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False, default=str)
+    _rotate()
+
+
+# Conservamos solo las PROFILE_KEEP capturas más recientes (el prefijo
+# empieza por la fecha, así que el orden alfabético es cronológico)
+def _rotate() -> None:
+    stems = sorted({p.name.split(".")[0] for p in PROFILE_DIR.iterdir()})
+    for stem in stems[:max(len(stems) - PROFILE_KEEP, 0)]:
+        for p in PROFILE_DIR.glob(stem + ".*"):
+            p.unlink(missing_ok=True)
+
+
+# Instrumentamos una función reactiva (calc o render): si la sesión tiene el
+# perfilado activo, abre la captura del ciclo y registra su duración
+def traced(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        session = get_current_session()
+        prof = _sessions.get(session.id) if session is not None else None
+        if prof is None:
+            return fn(*args, **kwargs)
+
+        cap = _begin(session, prof)
+        t0 = perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if cap is not None:
+                ms = (perf_counter() - t0) * 1000.0
+                cap["spans"].append((fn.__name__, ms))
+
+    return wrapper
@@ -0,0 +1,175 @@
+# Intervalos de confianza bootstrap para los KPIs de campaña (diferencia de
+# medianas de TotalSpend entre Response = 1 y 0, y tasa de Response = 1).
+# Generamos los remuestreos en bloque como una matriz de índices y
+# calculamos las medianas con partition a lo largo de cada fila
+from collections import OrderedDict
+from time import perf_counter
+import threading
+import numpy as np
+from data_prep import rows_digest
+
+# Definimos el presupuesto de latencia (s) y los límites del número de
+# remuestreos: siempre hacemos al menos BOOT_MIN y, si sobra presupuesto,
+# seguimos hasta BOOT_MAX. Un primer bloque de BOOT_PROBE remuestreos mide el
+# coste por valor remuestreado
+BOOT_BUDGET = 0.05
+BOOT_PROBE = 10
+BOOT_MIN = 200
+BOOT_MAX = 2000
+
+# Remuestreamos como máximo BOOT_SUBSAMPLE valores por grupo (bootstrap
+# m de n) y reescalamos las desviaciones por sqrt(m/n): el coste de cada
+# remuestreo deja de crecer con el número de filas. Si BOOT_MIN remuestreos
+# de ese tamaño no caben en el presupuesto reducimos m, hasta BOOT_M_MIN
+BOOT_SUBSAMPLE = 5000
+BOOT_M_MIN = 500
+
+# Limitamos el tamaño de cada bloque de remuestreos (celdas de la matriz de
+# índices) para acotar la memoria con muestras grandes
+MAX_CELLS = 4_000_000
+
+# Guardamos los resultados por estado de filtro (versión del dataset y
+# huella de las filas)
+MAX_CACHE = 512
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+# Calculamos la mediana de cada remuestreo (fila de la matriz de índices)
+# sin ordenar las filas completas
+def _medians(values: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    x = values[idx]
+    h = idx.shape[1] // 2
+    if idx.shape[1] % 2:
+        x.partition(h, axis=1)
+        return x[:, h]
+    x.partition([h - 1, h], axis=1)
+    return (x[:, h - 1] + x[:, h]) / 2.0
+
+
+# Calculamos la mediana de un grupo reordenándolo en su sitio (el grupo ya
+# es una copia propia y el orden no importa para remuestrear)
+def _median_inplace(x: np.ndarray) -> float:
+    h = x.size // 2
+    if x.size % 2:
+        x.partition(h)
+        return float(x[h])
+    x.partition([h - 1, h])
+    return float(x[h - 1] + x[h]) / 2.0
+
+
+# Generamos b remuestreos de m0 y m1 valores y devolvemos las desviaciones
+# de la diferencia de medianas, escaladas por sqrt(m/n)
+def _devs(rng, s0, s1, med0, med1, b, m0, m1) -> np.ndarray:
+    c0, c1 = np.sqrt(m0 / s0.size), np.sqrt(m1 / s1.size)
+    d0 = _medians(s0, rng.integers(0, s0.size, (b, m0), dtype=np.int32))
+    d1 = _medians(s1, rng.integers(0, s1.size, (b, m1), dtype=np.int32))
+    return c1 * (d1 - med1) - c0 * (d0 - med0)
+
+
+# Estimamos los intervalos bootstrap (percentil) de la diferencia de medianas
+# (1-0) y de la tasa de Response = 1. Con grupos de más de BOOT_SUBSAMPLE
+# filas remuestreamos m de n: la desviación de cada mediana remuestreada
+# respecto a la del grupo se escala por sqrt(m/n) (con m = n es el bootstrap
+# habitual). El presupuesto de latencia se cumple reduciendo m, no el número
+# de remuestreos: medimos aparte la preparación (separar los grupos y sus
+# medianas) y el coste por valor remuestreado
+def bootstrap_kpis(
+    spend: np.ndarray,
+    resp: np.ndarray,
+    budget: float = BOOT_BUDGET,
+    alpha: float = 0.05,
+    seed: int = 0,
+) -> dict:
+    t0 = perf_counter()
+    rng = np.random.default_rng(seed)
+    is1 = resp == 1
+    s0 = spend[~is1].astype(float)
+    s1 = spend[is1].astype(float)
+    k0, k1 = s0.size, s1.size
+    q = [alpha / 2.0, 1.0 - alpha / 2.0]
+
+    diff_ci = None
+    n_boot = BOOT_MIN
+    if k0 and k1:
+        med0, med1 = _median_inplace(s0), _median_inplace(s1)
+        t_setup = perf_counter() - t0
+
+        # Medimos el coste por valor remuestreado con un bloque pequeño de
+        # tamaño m completo
+        m0, m1 = min(k0, BOOT_SUBSAMPLE), min(k1, BOOT_SUBSAMPLE)
+        t = perf_counter()
+        devs = [_devs(rng, s0, s1, med0, med1, BOOT_PROBE, m0, m1)]
+        per_value = (perf_counter() - t) / (BOOT_PROBE * (m0 + m1))
+
+        # Reducimos m (en proporción en ambos grupos) para que BOOT_MIN
+        # remuestreos quepan en lo que queda de presupuesto; los del bloque
+        # de prueba solo se conservan si m no cambia
+        left = budget - t_setup - BOOT_PROBE * per_value * (m0 + m1)
+        fit = max(left, 0.0) / (BOOT_MIN * per_value)
+        if fit < m0 + m1:
+            scale = fit / (m0 + m1)
+            m0 = min(k0, max(BOOT_M_MIN, int(m0 * scale)))
+            m1 = min(k1, max(BOOT_M_MIN, int(m1 * scale)))
+            devs = []
+        n_boot = sum(d.size for d in devs)
+
+        # Completamos BOOT_MIN remuestreos y seguimos en bloques mientras
+        # quede presupuesto (hasta BOOT_MAX)
+        chunk = max(1, min(BOOT_MIN, MAX_CELLS // (m0 + m1)))
+        while n_boot < BOOT_MAX:
+            if n_boot >= BOOT_MIN:
+                left = budget - (perf_counter() - t0)
+                b = min(chunk, BOOT_MAX - n_boot,
+                        int(left / (per_value * (m0 + m1))))
+                if b <= 0:
+                    break
+            else:
+                b = min(chunk, BOOT_MIN - n_boot)
+            devs.append(_devs(rng, s0, s1, med0, med1, b, m0, m1))
+            n_boot += b
+        lo, hi = (med1 - med0) + np.quantile(np.concatenate(devs), q)
+        diff_ci = (float(lo), float(hi))
+
+    # La media remuestreada de un indicador 0/1 sigue una binomial: la
+    # obtenemos directamente (es barata, así que con al menos BOOT_MIN
+    # remuestreos)
+    n = resp.size
+    rates = rng.binomial(n, k1 / n, max(n_boot, BOOT_MIN)) / n
+    lo, hi = np.quantile(rates, q)
+
+    return {
+        "diff_ci": diff_ci,
+        "rate_ci": (float(lo), float(hi)),
+        "n_boot": int(n_boot),
+    }
+
+
+# Devolvemos los intervalos del estado de filtro dado (identificado por la
+# versión del dataset y la huella de sus filas), calculándolos solo la
+# primera vez. La semilla se deriva de la huella para que un mismo filtro
+# muestre siempre el mismo intervalo
+def cached_bootstrap(
+    version: str,
+    rows: np.ndarray,
+    spend: np.ndarray,
+    resp: np.ndarray,
+) -> dict:
+    digest = rows_digest(rows)
+    key = (version, digest)
+    with _lock:
+        res = _cache.get(key)
+        if res is not None:
+            _cache.move_to_end(key)
+            return res
+
+    # Calculamos fuera del cerrojo: el precálculo de arranque (warmup.py)
+    # llena esta caché desde otros hilos
+    seed = int.from_bytes(digest[:8], "little")
+    res = bootstrap_kpis(spend[rows], resp[rows], seed=seed)
+    with _lock:
+        _cache[key] = res
+        if len(_cache) > MAX_CACHE:
+            _cache.popitem(last=False)
+    return res
@@ -0,0 +1,5 @@
+# Los módulos de la App están en la raíz del repositorio (sin paquete)
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
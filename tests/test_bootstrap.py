@@ -0,0 +1,35 @@
+# Comprobamos que el presupuesto de latencia del bootstrap no reduce los
+# remuestreos por debajo de BOOT_MIN con grupos grandes (se reduce el
+# tamaño m del remuestreo m de n) y que el intervalo es estable entre
+# semillas
+import numpy as np
+import pytest
+
+from stats import bootstrap_kpis, BOOT_MIN
+
+N_ROWS = 500_000
+SEEDS = range(6)
+
+
+@pytest.fixture(scope="module")
+def kpis():
+    rng = np.random.default_rng(0)
+    spend = rng.gamma(1.2, 500.0, N_ROWS).round()
+    resp = (rng.random(N_ROWS) < 0.15).astype(np.int64)
+    return [bootstrap_kpis(spend, resp, seed=s) for s in SEEDS]
+
+
+def test_min_resamples(kpis):
+    assert all(r["n_boot"] >= BOOT_MIN for r in kpis)
+
+
+def test_ci_stable_across_seeds(kpis):
+    lo = np.array([r["diff_ci"][0] for r in kpis])
+    hi = np.array([r["diff_ci"][1] for r in kpis])
+    width = hi - lo
+    assert np.all(width > 0)
+
+    # La anchura y los extremos apenas cambian con la semilla
+    assert width.max() / width.min() < 1.3
+    assert np.ptp(lo) < 0.25 * width.mean()
+    assert np.ptp(hi) < 0.25 * width.mean()
@@ -0,0 +1,60 @@
+# Acotamos el coste de traducir una selección sobre el histograma de Income
+# a filas: el cliente envía un valor x por cada fila de las barras
+# seleccionadas, así que una barra grande repite su x miles de veces y no
+# debe repetir también la búsqueda
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_prep import build_row_index, rows_in_bins, rows_in_range
+
+N_ROWS = 400_000
+BINS = 40
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    income = rng.normal(52_000, 21_000, N_ROWS)
+    income[rng.random(N_ROWS) < 0.01] = np.nan
+    df = pd.DataFrame({"Income": income})
+    inc = income[~np.isnan(income)]
+    lo, hi = float(inc.min()), float(inc.max())
+    return build_row_index(df), inc, lo, (hi - lo) / BINS
+
+
+# Valores x que envía la selección de una barra: uno por cada fila
+def _bar_xs(inc, lo, size, b):
+    x = inc[(inc >= lo + b * size) & (inc < lo + (b + 1) * size)]
+    return [lo + (b + 0.5) * size] * x.size
+
+
+def test_large_bar_selection(data):
+    index, inc, lo, size = data
+    b = BINS // 2
+    xs = _bar_xs(inc, lo, size, b)
+    assert len(xs) > 30_000
+
+    t0 = time.perf_counter()
+    ids = rows_in_bins(index, "Income", xs, lo, size, BINS)
+    elapsed = time.perf_counter() - t0
+
+    expected = rows_in_range(index, "Income", lo + b * size,
+                             lo + (b + 1) * size)
+    assert ids.size == len(xs)
+    np.testing.assert_array_equal(ids, expected)
+    assert elapsed < 0.25
+
+
+def test_several_bars_and_last_edge(data):
+    index, inc, lo, size = data
+    xs = (_bar_xs(inc, lo, size, 3) + _bar_xs(inc, lo, size, BINS - 1)
+          + [lo + BINS * size])
+    ids = rows_in_bins(index, "Income", xs, lo, size, BINS)
+
+    # La última barra se cierra por la derecha (incluye el máximo)
+    assert ids.size == len(xs)
+    assert np.all(np.diff(ids) > 0)
+    assert rows_in_bins(index, "Income", [], lo, size, BINS).size == 0
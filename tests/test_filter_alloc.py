@@ -0,0 +1,72 @@
+# Acotamos la memoria extra que reserva cada cambio de filtro de una sesión:
+# la selección es un índice de filas sobre las columnas compartidas, así que
+# el coste es ~2 bytes por fila (las dos máscaras booleanas) más 8 bytes por
+# fila seleccionada (el índice), y cada vista solo reserva las columnas que
+# extrae
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_prep import filter_rows, take_cols
+
+N_ROWS = 200_000
+
+# Margen fijo para los objetos de Python (listas, DataFrame, metadatos)
+SLACK = 64 * 1024
+
+
+@pytest.fixture(scope="module")
+def df():
+    rng = np.random.default_rng(0)
+    income = rng.normal(52_000, 21_000, N_ROWS)
+    income[rng.random(N_ROWS) < 0.01] = np.nan
+    return pd.DataFrame({
+        "Recency": rng.integers(0, 100, N_ROWS),
+        "Income": income,
+        "TotalSpend": rng.integers(0, 2_500, N_ROWS),
+        "Response": rng.integers(0, 2, N_ROWS),
+    })
+
+
+# Medimos el pico de memoria reservada (sobre la de partida) al ejecutar fn
+def _peak_alloc(fn):
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        out = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return out, peak - base
+
+
+@pytest.mark.parametrize("state", [
+    {"recency": (10, 80), "income": (0, 90_000), "spend": (0, 2_000)},
+    {"recency": (0, 99), "income": (0, 200_000), "spend": (0, 2_500),
+     "response": 1},
+    {"recency": (0, 5), "income": (20_000, 30_000), "spend": (0, 100)},
+])
+def test_filter_change_alloc(df, state):
+    rows, extra = _peak_alloc(lambda: filter_rows(df, **state))
+    assert extra <= 2 * N_ROWS + 8 * rows.size + SLACK
+
+
+@pytest.mark.parametrize("cols", [
+    ["Response", "TotalSpend"],
+    ["Response", "Recency", "TotalSpend", "Income"],
+])
+def test_filtered_view_alloc(df, cols):
+    rows = filter_rows(
+        df, recency=(10, 80), income=(0, 90_000), spend=(0, 2_000)
+    )
+    d, extra = _peak_alloc(lambda: take_cols(df, rows, cols))
+
+    # Solo las columnas extraídas: ni copias del DataFrame ni bloques
+    # consolidados
+    gathered = sum(df[c].to_numpy().itemsize for c in cols) * rows.size
+    assert list(d.columns) == cols
+    assert extra <= gathered + SLACK
+
@@ -0,0 +1,123 @@
+# Precálculo de arranque: cuando se carga un dataset, ejecutamos en segundo
+# plano las tareas que calculan los agregados del estado de filtros por
+# defecto (para cada segmentación y cada selección de Response) y construyen
+# los esqueletos de sus figuras, de modo que la primera sesión tras un
+# despliegue no pague ese coste. Los agregados quedan en una caché compartida
+# entre sesiones, identificada por la versión del dataset y la huella de las
+# filas filtradas. El progreso se consulta en /health.
+#
+# Configuración:
+#   APP_WARMUP=0              desactiva el precálculo
+#   APP_WARMUP_WORKERS=1      hilos de trabajo (el trabajo de plotly y pandas
+#                             retiene el GIL: más hilos retrasarían las
+#                             sesiones en curso sin acabar antes)
+#   APP_WARMUP_PAUSE=0.02     pausa (s) de cada hilo entre tareas, para que
+#                             las sesiones abiertas durante el precálculo
+#                             tomen el intérprete
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+import os
+import sys
+import threading
+import time
+
+from starlette.responses import JSONResponse
+
+WARMUP_ENABLED = os.environ.get("APP_WARMUP", "1").strip().lower() not in (
+    "0", "false", "no",
+)
+WARMUP_WORKERS = max(1, int(os.environ.get("APP_WARMUP_WORKERS", "1")))
+WARMUP_PAUSE = max(0.0, float(os.environ.get("APP_WARMUP_PAUSE", "0.02")))
+
+# Limitamos el número de agregados guardados (uno por vista, segmentación y
+# estado de filtro)
+MAX_AGGREGATES = 1024
+
+_aggregates = OrderedDict()
+_status = {}
+_executor = None
+_lock = threading.Lock()
+
+
+# Devolvemos el agregado guardado para `key` o lo calculamos y guardamos. Los
+# valores se comparten entre sesiones y hilos: quien los usa no debe
+# modificarlos. El cálculo ocurre fuera del cerrojo
+def cached_aggregate(key: tuple, compute):
+    with _lock:
+        value = _aggregates.get(key)
+        if value is not None:
+            _aggregates.move_to_end(key)
+            return value
+
+    value = compute()
+    if value is not None:
+        with _lock:
+            _aggregates[key] = value
+            if len(_aggregates) > MAX_AGGREGATES:
+                _aggregates.popitem(last=False)
+    return value
+
+
+# Lanzamos las tareas `(etiqueta, función)` del precálculo de un dataset en
+# el grupo de hilos compartido (a lo sumo WARMUP_WORKERS a la vez)
+def start(name: str, tasks: list) -> None:
+    global _executor
+    if not WARMUP_ENABLED:
+        return
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=WARMUP_WORKERS,
+                thread_name_prefix="warmup",
+            )
+        st = {
+            "state": "running" if tasks else "done",
+            "done": 0,
+            "total": len(tasks),
+            "errors": [],
+            "seconds": 0.0 if tasks else None,
+        }
+        _status[name] = st
+
+    t0 = perf_counter()
+    for label, fn in tasks:
+        _executor.submit(_run, st, label, fn, t0)
+
+
+def _run(st: dict, label: str, fn, t0: float) -> None:
+    try:
+        fn()
+    except Exception as e:
+        # Un fallo no detiene el resto: la sesión calculará esa vista al
+        # pedirla
+        print(f"ERROR precálculo {label}: {e}", file=sys.stderr)
+        with _lock:
+            st["errors"].append(f"{label}: {e!r}")
+
+    with _lock:
+        st["done"] += 1
+        st["seconds"] = round(perf_counter() - t0, 3)
+        if st["done"] == st["total"]:
+            st["state"] = "done"
+    time.sleep(WARMUP_PAUSE)
+
+
+# Copiamos el progreso de cada dataset
+def status() -> dict:
+    with _lock:
+        return {
+            name: {**st, "errors": list(st["errors"])}
+            for name, st in _status.items()
+        }
+
+
+# Endpoint de salud: el servidor responde y, por dataset, el progreso del
+# precálculo ("warming" mientras quede alguna tarea)
+async def health(request) -> JSONResponse:
+    warm = status()
+    ready = all(st["state"] == "done" for st in warm.values())
+    return JSONResponse({
+        "status": "ok" if ready else "warming",
+        "warmup": warm,
+    })